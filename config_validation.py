@@ -1,5 +1,10 @@
+import csv
+import json
 import logging
 import argparse
+import os.path
+import sys
+from typing import Dict, Iterable, Iterator, List, Mapping
 
 from custom_components.light_motion_profiles import (
     build_domains,
@@ -7,19 +12,56 @@ from custom_components.light_motion_profiles import (
 from custom_components.light_motion_profiles.config import (
     RawConfig,
 )
+from custom_components.light_motion_profiles.coverage import (
+    dead_rules,
+    symbolic_unassigned,
+)
 from custom_components.light_motion_profiles.datatypes import (
     Config,
+    LightGroup,
 )
 from custom_components.light_motion_profiles.exhaustive import (
-    gen_light_group_matches,
+    MatchResult,
+    TruthTable,
+    build_truth_tables,
+    gen_light_group_matches_by_cell,
+)
+from custom_components.light_motion_profiles.truth_table_cache import (
+    TruthTableCache,
+    build_truth_tables_cached,
 )
 
 LOGGER = logging.getLogger(__name__)
 
+# table needs every row up front, csv/jsonl are written as the rows are generated
+FORMATS = ["table", "csv", "jsonl"]
+
 
 def build_argparse() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("config_file")
+    parser.add_argument(
+        "--no-numpy",
+        action="store_true",
+        help="Use the pure python truth table builder even if numpy is installed",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="~/.cache/light_motion_profiles",
+        help="Where to keep truth tables between runs",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Rebuild every truth table without reading or writing the cache",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of worker processes to build the truth tables with",
+    )
 
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -28,16 +70,114 @@ def build_argparse() -> argparse.ArgumentParser:
     )
     single_parser.add_argument("light_group")
 
-    subparsers.add_parser(
+    unassigned_parser = subparsers.add_parser(
         "unassigned", help="Search all light groups for any unassigned states"
     )
 
+    unassigned_parser.add_argument(
+        "--symbolic",
+        action="store_true",
+        help=(
+            "Work out the unassigned states from the rule conditions and show them "
+            "as a minimal set of patterns rather than every state"
+        ),
+    )
+
+    dead_rules_parser = subparsers.add_parser(
+        "dead-rules",
+        help="Find rules that can never match because of the rules before them",
+    )
+
+    for subparser in (single_parser, unassigned_parser):
+        subparser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default="table",
+            help=(
+                "csv and jsonl stream rows in (room, occupancy) order with bounded "
+                "memory, they ignore --jobs and --no-numpy"
+            ),
+        )
+    dead_rules_parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="table",
+        help="Output format, one row per dead rule",
+    )
+
     return parser
 
 
+def use_numpy(args) -> bool | None:
+    return False if args.no_numpy else None
+
+
+def user_columns(light_group: LightGroup) -> List[str]:
+    return [f"user: {user}" for user in sorted(light_group.get_rule_users())]
+
+
+def write_rows(fmt: str, fieldnames: List[str], rows: Iterable[Dict[str, str]]):
+    if fmt == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=fieldnames, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+    elif fmt == "jsonl":
+        for row in rows:
+            sys.stdout.write(json.dumps(row) + "\n")
+    else:
+        raise ValueError(f"Can't stream rows as '{fmt}'")
+
+
+def unassigned_row(light_group: str, result: MatchResult) -> Dict[str, str]:
+    row = {"light_group": light_group}
+    row.update(result.to_tabulate())
+    del row["rule_name"]
+    return row
+
+
+def gen_unassigned_rows(config: Config) -> Iterator[Dict[str, str]]:
+    for lg_name in sorted(config.lights):
+        light_group = config.lights[lg_name]
+        for result in gen_light_group_matches_by_cell(light_group, config):
+            if result.rule_name is None:
+                yield unassigned_row(lg_name, result)
+
+
+def gen_symbolic_unassigned_rows(config: Config) -> Iterator[Dict[str, str]]:
+    for lg_name in sorted(config.lights):
+        for result in symbolic_unassigned(config.lights[lg_name], config):
+            yield unassigned_row(lg_name, result)
+
+
+def build_tables(
+    args, config: Config, light_groups: List[str] | None = None
+) -> Mapping[str, TruthTable]:
+    if args.no_cache:
+        return build_truth_tables(
+            config, use_numpy(args), jobs=args.jobs, light_groups=light_groups
+        )
+
+    cache = TruthTableCache(os.path.expandvars(os.path.expanduser(args.cache_dir)))
+    return build_truth_tables_cached(
+        config, cache, use_numpy(args), jobs=args.jobs, light_groups=light_groups
+    )
+
+
 def cmd_single(args, config: Config):
-    light_group = config.lights[args.light_group]
-    results = list(gen_light_group_matches(light_group, config))
+    if args.format != "table":
+        light_group = config.lights[args.light_group]
+        write_rows(
+            args.format,
+            ["room_state", "occupancy"] + user_columns(light_group) + ["rule_name"],
+            (
+                r.to_tabulate()
+                for r in gen_light_group_matches_by_cell(light_group, config)
+            ),
+        )
+        return
+
+    table = build_tables(args, config, [args.light_group])[args.light_group]
+    results = list(table.rows(config))
     results.sort(key=lambda r: (r.room, r.occupancy))
 
     table = tabulate.tabulate((r.to_tabulate() for r in results), headers="keys")
@@ -45,26 +185,76 @@ def cmd_single(args, config: Config):
 
 
 def cmd_unassigned(args, config: Config):
+    if args.symbolic:
+        rows = gen_symbolic_unassigned_rows(config)
+    else:
+        rows = gen_unassigned_rows(config)
+
+    if args.format != "table":
+        columns = {
+            column
+            for light_group in config.lights.values()
+            for column in user_columns(light_group)
+        }
+        write_rows(
+            args.format,
+            ["light_group", "room_state", "occupancy"] + sorted(columns),
+            rows,
+        )
+        return
+    elif args.symbolic:
+        out = list(rows)
+        if out:
+            print(tabulate.tabulate(out, headers="keys"))
+        return
+
     unassigned = []
-    for lg_name, light_group in config.lights.items():
-        for result in gen_light_group_matches(light_group, config):
-            if result.rule_name is None:
-                unassigned.append((lg_name, result))
+    tables = build_tables(args, config)
+    for lg_name, table in tables.items():
+        for index in table.unassigned():
+            unassigned.append((lg_name, table.row(index, config)))
 
     if unassigned:
         unassigned.sort(key=lambda r: (r[0], r[1].room, r[1].occupancy))
         out = []
         for lg, result in unassigned:
-            row = {"light_group": lg}
-            row.update(result.to_tabulate())
-            del row["rule_name"]
-            out.append(row)
+            out.append(unassigned_row(lg, result))
+
+        print(tabulate.tabulate(out, headers="keys"))
+
+
+def cmd_dead_rules(args, config: Config):
+    out = []
+    for lg_name in sorted(config.lights):
+        light_group = config.lights[lg_name]
+        # Rules that are also dead once unknown states are considered are the
+        # ones dropped when the integration is set up
+        pruned = {d.index for d in dead_rules(light_group, config, True)}
+        for dead in dead_rules(light_group, config):
+            if dead.shadowed_by:
+                reason = "shadowed by " + ", ".join(
+                    r.state_name for r in dead.shadowed_by
+                )
+            else:
+                reason = "never matches"
+            out.append(
+                {
+                    "light_group": lg_name,
+                    "index": str(dead.index),
+                    "rule_name": dead.rule.state_name,
+                    "reason": reason,
+                    "pruned": "yes" if dead.index in pruned else "no",
+                }
+            )
 
+    if args.format != "table":
+        fieldnames = ["light_group", "index", "rule_name", "reason", "pruned"]
+        write_rows(args.format, fieldnames, out)
+    elif out:
         print(tabulate.tabulate(out, headers="keys"))
 
 
 if __name__ == "__main__":
-    import os.path
     import yaml
     import tabulate
     import voluptuous as vol
@@ -82,10 +272,12 @@ if __name__ == "__main__":
     )(data)
 
     raw_config = RawConfig.from_yaml(data)
-    domains = build_domains()
+    domains = build_domains(raw_config.settings.internal_entities)
     config = Config(raw_config, domains)
 
     if args.command == "single":
         cmd_single(args, config)
     elif args.command == "unassigned":
         cmd_unassigned(args, config)
+    elif args.command == "dead-rules":
+        cmd_dead_rules(args, config)
@@ -1,10 +1,13 @@
+import dataclasses
 import logging
 import voluptuous as vol
-from typing import Any, Mapping
+from typing import Any, Collection, Mapping
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import Event, HomeAssistant, callback
 from homeassistant.helpers import discovery
 from homeassistant.const import (
+    EVENT_HOMEASSISTANT_STOP,
+    EVENT_STATE_CHANGED,
     Platform,
 )
 
@@ -13,8 +16,14 @@ from .dashboards import (
     MotionDebugDashboard,
 )
 from .config import RawConfig
+from .actuator import DATA_ACTUATOR, LightActuator
+from .coverage import prune_dead_rules
 from .datatypes import Config
 from .datatypes.entity import Domain, Domains
+from .graph import DATA_GRAPH, DependencyGraph
+from .reconciler import DATA_RECONCILER, LightReconciler
+from .store import DATA_STORE, StateStore
+from .timeouts import DATA_TIMEOUTS, OccupancyTimeouts
 
 
 LOGGER = logging.getLogger(__name__)
@@ -31,11 +40,9 @@ CONFIG_SCHEMA = vol.Schema(
     extra=vol.ALLOW_EXTRA,
 )
 
-GROUP_SEPARATOR = ","
 
-
-def build_domains() -> Domains:
-    return Domains(
+def build_domains(internal: Collection[str] = ()) -> Domains:
+    domains = Domains(
         person_home_away=Domain.SENSOR,
         person_home_away_override=Domain.SELECT,
         person_state=Domain.SELECT,
@@ -47,16 +54,49 @@ def build_domains() -> Domains:
         room_occupancy=Domain.SENSOR,
         light_rule=Domain.SENSOR,
         light_automation=Domain.SENSOR,
+        mesh_queue=Domain.SENSOR,
+        reconciler=Domain.SENSOR,
     )
+    # Entities kept internal are only values inside the integration
+    return dataclasses.replace(domains, **{name: Domain.INTERNAL for name in internal})
 
 
 async def async_setup(hass: HomeAssistant, whole_config: Mapping[str, Any]) -> bool:
     # LOGGER.warning(whole_config[DOMAIN])
     raw_config = RawConfig.from_yaml(whole_config[DOMAIN])
-    domains = build_domains()
+    domains = build_domains(raw_config.settings.internal_entities)
     # LOGGER.warning(domains)
     config = Config(raw_config, domains)
     # LOGGER.warning(config)
+    await hass.async_add_executor_job(prune_dead_rules, config)
+    graph = DependencyGraph.from_config(config, hass.loop)
+    hass.data[DATA_GRAPH] = graph
+    hass.data[DATA_STORE] = StateStore(hass)
+    actuator = LightActuator(hass, config.settings.meshes)
+    hass.data[DATA_ACTUATOR] = actuator
+    # Light commands from a fast pass go out before its state writes
+    graph.add_fast_pass_hook(actuator.flush)
+    hass.data[DATA_TIMEOUTS] = OccupancyTimeouts(
+        graph, hass.loop, config.settings.room.occupancy_timeout_granularity
+    )
+    unsub_state_changed = hass.bus.async_listen(
+        EVENT_STATE_CHANGED, graph.async_state_changed, graph.async_is_input
+    )
+    reconciler = LightReconciler(
+        hass,
+        actuator,
+        config.settings.reconcile_interval,
+        config.settings.reconcile_batch_size,
+    )
+    hass.data[DATA_RECONCILER] = reconciler
+    stop_reconciler = reconciler.start()
+
+    @callback
+    def async_stop(event: Event) -> None:
+        unsub_state_changed()
+        stop_reconciler()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop)
 
     await discovery.async_load_platform(
         hass,
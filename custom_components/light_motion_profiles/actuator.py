@@ -0,0 +1,301 @@
+"""
+Batches the light service calls of every light automation and rate limits the
+ones sent to a mesh.
+"""
+import asyncio
+import heapq
+import logging
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+from homeassistant.components.light import (
+    ATTR_BRIGHTNESS,
+    ATTR_BRIGHTNESS_PCT,
+    ATTR_TRANSITION,
+    DOMAIN as LIGHT_DOMAIN,
+)
+from homeassistant.const import (
+    ATTR_ENTITY_ID,
+    SERVICE_TURN_OFF,
+    SERVICE_TURN_ON,
+    STATE_OFF,
+    STATE_ON,
+)
+from homeassistant.core import HomeAssistant
+
+from .datatypes import MeshSettings
+
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_ACTUATOR = "light_motion_profiles_actuator"
+
+# (service, sorted service data without the entity id)
+Command = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+# Seconds on top of the transition that a light is given to report the state it
+# was sent before the same command is sent again
+IN_FLIGHT_GRACE = 2.0
+
+
+@dataclass
+class SentCommand:
+    command: Command
+    # Loop time until which the light is assumed to still be getting there
+    until: float
+
+
+def brightness_from_pct(pct: float) -> int:
+    # The same conversion the light integration does for brightness_pct
+    return round(pct * 255 / 100)
+
+
+@dataclass
+class QueuedCommand:
+    command: Command
+    # Lower goes first
+    priority: int
+    queued_at: float
+
+
+class MeshQueue:
+    """
+    The commands waiting to be sent to the lights of a mesh
+    """
+
+    def __init__(self, name: str, settings: MeshSettings, now: float) -> None:
+        self.name = name
+        self._patterns = settings.lights
+        self._rate = settings.rate
+        self._burst = settings.burst
+        self._tokens = float(settings.burst)
+        self._refilled = now
+
+        self.queue: Dict[str, QueuedCommand] = {}
+        self.timer: asyncio.TimerHandle | None = None
+
+        self.sent = 0
+        self.superseded = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self._listeners: List[Callable[[], None]] = []
+
+    def matches(self, entity_id: str) -> bool:
+        return any(fnmatchcase(entity_id, pattern) for pattern in self._patterns)
+
+    def put(self, entity_id: str, command: Command, now: float) -> None:
+        queued = self.queue.get(entity_id)
+        if queued is not None and queued.command != command:
+            self.superseded += 1
+        self.queue[entity_id] = QueuedCommand(
+            command,
+            priority=0 if command[0] == SERVICE_TURN_ON else 1,
+            # A light that was already waiting keeps its place
+            queued_at=now if queued is None else queued.queued_at,
+        )
+
+    def discard(self, entity_id: str) -> None:
+        self.queue.pop(entity_id, None)
+
+    def take(self, now: float) -> List[Tuple[str, Command]]:
+        """
+        Removes the commands the bucket allows to be sent now, most important
+        first
+        """
+        elapsed = now - self._refilled
+        self._tokens = min(self._burst, self._tokens + elapsed * self._rate)
+        self._refilled = now
+
+        count = min(int(self._tokens), len(self.queue))
+        self._tokens -= count
+        ready = heapq.nsmallest(
+            count,
+            self.queue.items(),
+            key=lambda item: (item[1].priority, item[1].queued_at),
+        )
+
+        out = []
+        for entity_id, queued in ready:
+            del self.queue[entity_id]
+            self.sent += 1
+            self.last_wait = now - queued.queued_at
+            self.max_wait = max(self.max_wait, self.last_wait)
+            out.append((entity_id, queued.command))
+        return out
+
+    def next_token(self) -> float:
+        """
+        Seconds until another command can be sent
+        """
+        return max(0.0, (1 - self._tokens) / self._rate)
+
+    def metrics(self, now: float) -> Dict[str, Any]:
+        oldest = min((q.queued_at for q in self.queue.values()), default=now)
+        return {
+            "oldest_wait": round(now - oldest, 3),
+            "last_wait": round(self.last_wait, 3),
+            "max_wait": round(self.max_wait, 3),
+            "sent": self.sent,
+            "superseded": self.superseded,
+        }
+
+    def add_listener(self, listener: Callable[[], None]) -> Callable[[], None]:
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def notify(self) -> None:
+        for listener in self._listeners:
+            listener()
+
+
+class LightActuator:
+    def __init__(
+        self, hass: HomeAssistant, meshes: Mapping[str, MeshSettings] | None = None
+    ) -> None:
+        self._hass = hass
+        now = hass.loop.time()
+        self.meshes = {
+            name: MeshQueue(name, settings, now)
+            for name, settings in (meshes or {}).items()
+        }
+        self._light_meshes: Dict[str, MeshQueue | None] = {}
+
+        # Only the latest command for a light is sent
+        self._pending: Dict[str, Command] = {}
+        self._sent: Dict[str, SentCommand] = {}
+        self._flush_handle: asyncio.Handle | None = None
+
+    def matches(self, service: str, entity_id: str, data: Mapping[str, Any]) -> bool:
+        """
+        Whether the light is already in the state the command would put it in
+        """
+        state = self._hass.states.get(entity_id)
+        if state is None:
+            return False
+        if service == SERVICE_TURN_OFF:
+            return state.state == STATE_OFF
+        if state.state != STATE_ON:
+            return False
+
+        pct = data.get(ATTR_BRIGHTNESS_PCT)
+        if pct is None:
+            return True
+        brightness = state.attributes.get(ATTR_BRIGHTNESS)
+        # Lights don't always report back exactly the brightness they were sent
+        return (
+            brightness is not None and abs(brightness - brightness_from_pct(pct)) <= 1
+        )
+
+    def call(self, service: str, entity_id: str, data: Mapping[str, Any]) -> bool:
+        """
+        Queues the command unless it wouldn't change anything, returns True if
+        it was queued
+        """
+        command = (service, tuple(sorted(data.items())))
+        sent = self._sent.get(entity_id)
+        if sent is not None and self._hass.loop.time() < sent.until:
+            # The light's state is stale until the command in flight lands, eg it
+            # still reads on while a turn_off transitions, so only a repeat of
+            # that command is no change
+            unchanged = sent.command == command
+        else:
+            unchanged = self.matches(service, entity_id, data)
+        if unchanged:
+            _LOGGER.debug(f"not sending {service} {data} to {entity_id}, no change")
+            # Anything queued earlier is no longer wanted either
+            self._pending.pop(entity_id, None)
+            mesh = self._mesh(entity_id)
+            if mesh is not None and entity_id in mesh.queue:
+                mesh.discard(entity_id)
+                mesh.notify()
+            return False
+
+        self._pending[entity_id] = command
+        if self._flush_handle is None:
+            self._flush_handle = self._hass.loop.call_soon(self._flush)
+        return True
+
+    def is_queued(self, entity_id: str) -> bool:
+        mesh = self._mesh(entity_id)
+        return entity_id in self._pending or (
+            mesh is not None and entity_id in mesh.queue
+        )
+
+    def _mesh(self, entity_id: str) -> MeshQueue | None:
+        if entity_id not in self._light_meshes:
+            self._light_meshes[entity_id] = next(
+                (m for m in self.meshes.values() if m.matches(entity_id)), None
+            )
+        return self._light_meshes[entity_id]
+
+    def flush(self) -> None:
+        """
+        Sends the pending commands now rather than at the end of the loop
+        iteration, starting the service calls before returning
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush(eager=True)
+
+    def _flush(self, eager: bool = False) -> None:
+        self._flush_handle = None
+        now = self._hass.loop.time()
+
+        unlimited = []
+        queued: Dict[str, MeshQueue] = {}
+        for entity_id, command in self._pending.items():
+            mesh = self._mesh(entity_id)
+            if mesh is None:
+                unlimited.append((entity_id, command))
+            else:
+                mesh.put(entity_id, command, now)
+                queued[mesh.name] = mesh
+        self._pending = {}
+
+        self._send(unlimited, now, eager)
+        for mesh in queued.values():
+            self._drain(mesh, eager)
+
+    def _drain(self, mesh: MeshQueue, eager: bool = False) -> None:
+        now = self._hass.loop.time()
+        self._send(mesh.take(now), now, eager)
+        if mesh.queue and mesh.timer is None:
+            mesh.timer = self._hass.loop.call_later(
+                mesh.next_token(), self._drain_later, mesh
+            )
+        mesh.notify()
+
+    def _drain_later(self, mesh: MeshQueue) -> None:
+        mesh.timer = None
+        self._drain(mesh)
+
+    def _send(
+        self, commands: Iterable[Tuple[str, Command]], now: float, eager: bool
+    ) -> None:
+        batches: Dict[Command, List[str]] = {}
+        for entity_id, command in commands:
+            batches.setdefault(command, []).append(entity_id)
+            transition = dict(command[1]).get(ATTR_TRANSITION, 0)
+            self._sent[entity_id] = SentCommand(
+                command, now + transition + IN_FLIGHT_GRACE
+            )
+
+        for (service, data), entity_ids in batches.items():
+            service_data = {**dict(data), ATTR_ENTITY_ID: entity_ids}
+            _LOGGER.info(f"calling service {LIGHT_DOMAIN}.{service}, {service_data}")
+            coro = self._hass.services.async_call(
+                LIGHT_DOMAIN,
+                service,
+                service_data,
+                blocking=False,
+            )
+            if eager:
+                # Runs the call up to the light's own await straight away
+                self._hass.async_create_task(coro, eager_start=True)
+            else:
+                self._hass.async_create_task(coro)
+
+
+def get_actuator(hass: HomeAssistant) -> LightActuator:
+    return hass.data[DATA_ACTUATOR]
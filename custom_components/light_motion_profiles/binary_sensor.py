@@ -1,14 +1,16 @@
+from typing import List, Set
+
 from homeassistant.components.binary_sensor import (
     BinarySensorDeviceClass,
     BinarySensorEntity,
     DOMAIN as BS_DOMAIN,
 )
-from homeassistant.const import STATE_ON
+from homeassistant.const import STATE_ON, STATE_OFF
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import Event, HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .sensor import CalculatedSensor
+from .sensor import CalculatedSensor, async_add_calculated
 from .datatypes import Config, LightGroup
 
 
@@ -18,12 +20,12 @@ async def async_setup_platform(
     async_add_entities: AddEntitiesCallback,
     config: Config,
 ) -> None:
-    motion_groups = []
+    motion_groups: List[CalculatedSensor] = []
     for light_config in config.lights.values():
         if isinstance(light_config.occupancy_sensors, list):
             motion_groups.append(MotionGroup(light_config))
 
-    async_add_entities(motion_groups)
+    await async_add_calculated(hass, async_add_entities, motion_groups)
 
 
 class MotionGroup(CalculatedSensor[bool], BinarySensorEntity):
@@ -33,16 +35,48 @@ class MotionGroup(CalculatedSensor[bool], BinarySensorEntity):
         super().__init__()
 
         entity = config.motion_sensor_group_entity
-        assert entity.domain.value == BS_DOMAIN
+        self._set_entity(entity, BS_DOMAIN)
         assert isinstance(config.occupancy_sensors, list)
 
-        self._attr_name = entity.name
         self._attr_device_class = BinarySensorDeviceClass.MOTION
         self._dependent_entities = [e.entity for e in config.occupancy_sensors]
 
+        # The sensors that are currently on, kept up to date from the state
+        # changes so an event doesn't need to look at every sensor of the room.
+        # None until the sensors are scanned
+        self._sensors_on: Set[str] | None = None
+
+    async def async_added_to_hass(self) -> None:
+        # The sensors could have changed while we weren't being sent events
+        self._sensors_on = None
+        await super().async_added_to_hass()
+
+    def _input_changed(self, event: Event) -> None:
+        if self._sensors_on is None:
+            return
+
+        entity_id = event.data["entity_id"]
+        new_state = event.data["new_state"]
+        if new_state is None or new_state.state not in (STATE_ON, STATE_OFF):
+            # Rescan rather than trying to track unavailable sensors
+            self._sensors_on = None
+        elif new_state.state == STATE_ON:
+            self._sensors_on.add(entity_id)
+        else:
+            self._sensors_on.discard(entity_id)
+
     def calculate_current_state(self) -> bool:
-        for entity in self._dependent_entities:
-            state = self.hass.states.get(entity)
-            if state is not None and state.state == STATE_ON:
-                return True
-        return False
+        if self._sensors_on is None:
+            self._sensors_on = set()
+            for entity in self._dependent_entities:
+                state = self.hass.states.get(entity)
+                if state is not None and state.state == STATE_ON:
+                    self._sensors_on.add(entity)
+        return bool(self._sensors_on)
+
+    def calculate_current_value(self) -> str:
+        # Kept the way a single motion sensor reads so rooms treat both the same
+        return STATE_ON if self.calculate_current_state() else STATE_OFF
+
+    def _serialize(self, value: str) -> bool:
+        return value == STATE_ON
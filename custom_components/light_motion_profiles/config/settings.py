@@ -62,15 +62,20 @@ class OccupancyStates:
 @dataclass
 class RoomSettings:
     FIELD_VALID_ROOM_STATES = "valid_room_states"
+    FIELD_OCCUPANCY_TIMEOUT_GRANULARITY = "occupancy_timeout_granularity"
 
     valid_room_states: Set[str]
     occupancy_states: OccupancyStates
+    occupancy_timeout_granularity: float
 
     @classmethod
-    def from_yaml(cls, data: Mapping[str, List[str]]) -> "RoomSettings":
+    def from_yaml(cls, data: Mapping[str, Any]) -> "RoomSettings":
         return cls(
             valid_room_states=set(data[cls.FIELD_VALID_ROOM_STATES]),
             occupancy_states=OccupancyStates.from_yaml(),
+            occupancy_timeout_granularity=data.get(
+                cls.FIELD_OCCUPANCY_TIMEOUT_GRANULARITY, 0.0
+            ),
         )
 
     @classmethod
@@ -78,6 +83,11 @@ class RoomSettings:
         return vol.Schema(
             {
                 vol.Required(cls.FIELD_VALID_ROOM_STATES): unique_list(cv.string),
+                # Seconds to round occupancy timeouts up to so rooms timing out
+                # around the same time are emptied together
+                vol.Optional(
+                    cls.FIELD_OCCUPANCY_TIMEOUT_GRANULARITY, default=0.0
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
             },
         )
 
@@ -147,16 +157,80 @@ class DashboardSettings:
         return vol.Schema(vol.Any(None, {}))
 
 
+@dataclass
+class MeshSettings:
+    """
+    A set of lights that share a radio network, commands to them are rate
+    limited so the network isn't flooded
+    """
+
+    FIELD_LIGHTS = "lights"
+    FIELD_RATE = "rate"
+    FIELD_BURST = "burst"
+
+    # fnmatch patterns of light entity ids
+    lights: List[str]
+    # Commands per second
+    rate: float
+    # Commands that can be sent at once after the mesh has been quiet
+    burst: int
+
+    @classmethod
+    def from_yaml(cls, data: Mapping[str, Any]) -> "MeshSettings":
+        return cls(
+            lights=data[cls.FIELD_LIGHTS],
+            rate=data[cls.FIELD_RATE],
+            burst=data.get(cls.FIELD_BURST, 1),
+        )
+
+    @classmethod
+    def vol(cls) -> vol.Schema:
+        return vol.Schema(
+            {
+                vol.Required(cls.FIELD_LIGHTS): unique_list(cv.string),
+                vol.Required(cls.FIELD_RATE): vol.All(
+                    vol.Coerce(float), vol.Range(min=0, min_included=False)
+                ),
+                vol.Optional(cls.FIELD_BURST, default=1): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+            }
+        )
+
+
 @dataclass
 class AllSettings:
     room: RoomSettings
     users_groups: UserGroupSettings
     dashboard: DashboardSettings | None
     killswitch: KillswitchSettings
+    update_debounce: float
+    meshes: Mapping[str, MeshSettings]
+    reconcile_interval: float
+    reconcile_batch_size: int
+    motion_fast_path: bool
+    internal_entities: Set[str]
 
     FIELD_ROOM_SETTINGS = "room"
     FIELD_USER_GROUP_SETTINGS = "user_group"
     FIELD_DASHBOARD_SETTINGS = "debug_dashboard"
+    FIELD_UPDATE_DEBOUNCE = "update_debounce"
+    FIELD_MESHES = "meshes"
+    FIELD_RECONCILE_INTERVAL = "reconcile_interval"
+    FIELD_RECONCILE_BATCH_SIZE = "reconcile_batch_size"
+    FIELD_MOTION_FAST_PATH = "motion_fast_path"
+    FIELD_INTERNAL_ENTITIES = "internal_entities"
+
+    # The calculated entities that can be kept internal, by their Domains field
+    INTERNAL_LAYERS = [
+        "person_home_away",
+        "person_presence",
+        "group_presence",
+        "motion_sensor_group",
+        "room_occupancy",
+        "light_rule",
+        "light_automation",
+    ]
 
     @classmethod
     def from_yaml(cls, data: Mapping[str, Any]) -> "AllSettings":
@@ -169,6 +243,15 @@ class AllSettings:
             if cls.FIELD_DASHBOARD_SETTINGS in data
             else None,
             killswitch=KillswitchSettings.from_yaml(),
+            update_debounce=data.get(cls.FIELD_UPDATE_DEBOUNCE, 0.0),
+            meshes={
+                name: MeshSettings.from_yaml(mesh)
+                for name, mesh in data.get(cls.FIELD_MESHES, {}).items()
+            },
+            reconcile_interval=data.get(cls.FIELD_RECONCILE_INTERVAL, 0.0),
+            reconcile_batch_size=data.get(cls.FIELD_RECONCILE_BATCH_SIZE, 5),
+            motion_fast_path=data.get(cls.FIELD_MOTION_FAST_PATH, False),
+            internal_entities=set(data.get(cls.FIELD_INTERNAL_ENTITIES, [])),
         )
 
     @classmethod
@@ -178,5 +261,30 @@ class AllSettings:
                 vol.Required(cls.FIELD_ROOM_SETTINGS): RoomSettings.vol(),
                 vol.Required(cls.FIELD_USER_GROUP_SETTINGS): UserGroupSettings.vol(),
                 cls.FIELD_DASHBOARD_SETTINGS: DashboardSettings.vol(),
+                # Seconds to wait collecting input changes before recalculating,
+                # by default everything changed in the same loop iteration
+                vol.Optional(cls.FIELD_UPDATE_DEBOUNCE, default=0.0): vol.All(
+                    vol.Coerce(float), vol.Range(min=0)
+                ),
+                vol.Optional(cls.FIELD_MESHES, default={}): {
+                    cv.string: MeshSettings.vol()
+                },
+                # Seconds between checks that lights reached the state they were
+                # sent, and how many lights each check covers. Off (0) by default
+                # since it also undoes changes made to the lights by hand
+                vol.Optional(cls.FIELD_RECONCILE_INTERVAL, default=0.0): vol.All(
+                    vol.Coerce(float), vol.Range(min=0)
+                ),
+                vol.Optional(cls.FIELD_RECONCILE_BATCH_SIZE, default=5): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+                # Handle occupancy sensor changes as soon as they arrive and send
+                # the light commands before publishing the entities in between
+                vol.Optional(cls.FIELD_MOTION_FAST_PATH, default=False): cv.boolean,
+                # Entities only used by other entities of the integration can be
+                # kept out of hass (and the recorder) altogether
+                vol.Optional(cls.FIELD_INTERNAL_ENTITIES, default=[]): unique_list(
+                    vol.In(cls.INTERNAL_LAYERS)
+                ),
             }
         )
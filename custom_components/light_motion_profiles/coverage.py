@@ -0,0 +1,387 @@
+"""
+Symbolic coverage of light group rules, where every rule is a cube of the values
+it allows in each dimension.
+"""
+
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from .datatypes import Config, LightGroup, LightRule, StateEncoding, UsersGroups
+from .datatypes.match import (
+    MatchSingle,
+    MatchSingleAny,
+    MatchSingleExplicit,
+    MatchUserSingle,
+)
+from .exhaustive import MatchResult, Options, RuleUserDomains, Wildcard, cell_states
+
+_LOGGER = logging.getLogger(__name__)
+
+# One bitmask of allowed values per dimension
+Cube = Tuple[int, ...]
+
+# Stands in for any room/occupancy state that isn't configured
+UNKNOWN_STATE = "<unknown>"
+
+
+def _bits(mask: int) -> Iterator[int]:
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def _intersects(a: Cube, b: Cube) -> bool:
+    return all(x & y for x, y in zip(a, b))
+
+
+def _contains(outer: Cube, inner: Cube) -> bool:
+    return all(i & o == i for o, i in zip(outer, inner))
+
+
+def subtract(a: Cube, b: Cube) -> List[Cube]:
+    """
+    Disjoint cubes that together cover everything in a that isn't in b
+    """
+    if not _intersects(a, b):
+        return [a]
+
+    out = []
+    current = list(a)
+    for dim, (x, y) in enumerate(zip(a, b)):
+        if x & ~y:
+            out.append(tuple(current[:dim] + [x & ~y] + current[dim + 1 :]))
+        current[dim] = x & y
+    return out
+
+
+def uncovered(universe: Cube, cubes: Sequence[Cube]) -> List[Cube]:
+    # A cube with no values in some dimension is empty
+    remaining = [universe] if all(universe) else []
+    for cube in cubes:
+        remaining = [piece for r in remaining for piece in subtract(r, cube)]
+    return remaining
+
+
+def merge(cubes: Sequence[Cube]) -> List[Cube]:
+    """
+    Repeatedly merges pairs of cubes that only differ in a single dimension
+    """
+    out = list(dict.fromkeys(cubes))
+    merged = True
+    while merged:
+        merged = False
+        for i, j in itertools.combinations(range(len(out)), 2):
+            a, b = out[i], out[j]
+            diff = [dim for dim, (x, y) in enumerate(zip(a, b)) if x != y]
+            if len(diff) <= 1:
+                dim = diff[0] if diff else 0
+                out[i] = tuple(
+                    x | y if d == dim else x for d, (x, y) in enumerate(zip(a, b))
+                )
+                del out[j]
+                merged = True
+                break
+    return out
+
+
+def _expand(cube: Cube, sizes: Sequence[int], off: Sequence[Cube]) -> Cube:
+    """
+    Grows a cube one value at a time for as long as it doesn't touch any of the
+    off cubes
+    """
+    current = list(cube)
+    for dim, size in enumerate(sizes):
+        full = (1 << size) - 1
+        # Single values are added to what has been grown so far, so every value
+        # that fits ends up in the cube
+        for value in [full] + [1 << b for b in range(size)]:
+            candidate = current[dim] | value
+            if candidate == current[dim]:
+                continue
+            grown = tuple(current[:dim] + [candidate] + current[dim + 1 :])
+            if not any(_intersects(grown, o) for o in off):
+                current[dim] = candidate
+    return tuple(current)
+
+
+def minimize(
+    cubes: Sequence[Cube], sizes: Sequence[int], off: Sequence[Cube]
+) -> List[Cube]:
+    """
+    A smaller set of cubes covering the same space as cubes, given that space is
+    exactly the space not covered by off
+    """
+    expanded = list(dict.fromkeys(_expand(c, sizes, off) for c in merge(cubes)))
+    expanded.sort(key=lambda c: sum(bin(x).count("1") for x in c), reverse=True)
+
+    out: List[Cube] = []
+    for i, cube in enumerate(expanded):
+        if any(_contains(o, cube) for o in out):
+            continue
+        # Drop cubes that are covered by the union of all the others
+        others = out + expanded[i + 1 :]
+        if uncovered(cube, others):
+            out.append(cube)
+    return out
+
+
+def _with_referenced(states: List[str], matches: Sequence[MatchSingle]) -> List[str]:
+    """
+    The states plus every other state the matches name and one standing in for
+    the rest
+    """
+    referenced = set()
+    for m in matches:
+        if isinstance(m, MatchSingleExplicit):
+            referenced.add(m.value)
+        elif isinstance(m, MatchSingleAny):
+            referenced |= m.value
+    return states + sorted(referenced - set(states)) + [UNKNOWN_STATE]
+
+
+@dataclass
+class CubeSpace:
+    """
+    The dimensions of the rule space of a single light group
+    """
+
+    room_states: List[str]
+    occupancy_states: List[str]
+
+    # Groups of rule users whose states depend on each other, and all the
+    # combinations of states each of them can be in
+    components: List[List[str]]
+    component_domains: List[List[Tuple[int, ...]]]
+
+    @classmethod
+    def for_light_group(
+        cls, group: LightGroup, config: Config, include_unknown: bool = False
+    ) -> "CubeSpace":
+        """
+        With include_unknown every dimension also gets the states that aren't
+        configured but are named by a rule (eg a person that is "unavailable")
+        and one more value standing in for any other state, which every rule
+        treats the same
+        """
+        room_states, occupancy_states = cell_states(config)
+        domains = RuleUserDomains.from_config(config)
+        if include_unknown:
+            room_states = _with_referenced(
+                room_states, [r.rule_match.room_state for r in group.rules]
+            )
+            occupancy_states = _with_referenced(
+                occupancy_states, [r.rule_match.occupancy for r in group.rules]
+            )
+            # Person states the rules reference were interned when they were
+            # built, each of them is a value of its own
+            interned = [
+                1 << i for i in range(len(config.settings.state_encoding.states))
+            ]
+            extra = [
+                state
+                for state in interned
+                if state not in domains.single_person_states
+                and state != domains.absent_state
+            ]
+            # A bit that the encoding hasn't given to any state yet
+            unknown = 1 << len(interned)
+            domains.single_person_states = (
+                domains.single_person_states + extra + [unknown]
+            )
+        components = domains.components(group.get_rule_users())
+        return cls(
+            room_states=room_states,
+            occupancy_states=occupancy_states,
+            components=components,
+            component_domains=[domains.component_domain(c) for c in components],
+        )
+
+    @property
+    def sizes(self) -> List[int]:
+        return [len(self.room_states), len(self.occupancy_states)] + [
+            len(domain) for domain in self.component_domains
+        ]
+
+    def universe(self) -> Cube:
+        return tuple((1 << size) - 1 for size in self.sizes)
+
+    def rule_cube(self, rule: LightRule) -> Cube:
+        rule_match = rule.rule_match
+        room = 0
+        for i, room_state in enumerate(self.room_states):
+            if rule_match.room_state.match(room_state):
+                room |= 1 << i
+        occupancy = 0
+        for i, occupancy_state in enumerate(self.occupancy_states):
+            if rule_match.occupancy.match(occupancy_state):
+                occupancy |= 1 << i
+
+        out = [room, occupancy]
+        for names, domain in zip(self.components, self.component_domains):
+            matchers = [
+                m
+                for m in rule_match.user_state
+                if isinstance(m, MatchUserSingle) and m.user in names
+            ]
+            mask = 0
+            for i, states in enumerate(domain):
+                user_state = dict(zip(names, states))
+                if all(m.match(user_state) for m in matchers):
+                    mask |= 1 << i
+            out.append(mask)
+        return tuple(out)
+
+
+def _render_values(
+    values: List[str], all_values: int, mask: int
+) -> str | Wildcard | Options:
+    if mask == all_values:
+        return Wildcard()
+    elif mask & (mask - 1) == 0:
+        return values[mask.bit_length() - 1]
+    return Options({values[b] for b in _bits(mask)})
+
+
+def _render_component(
+    names: List[str],
+    domain: List[Tuple[int, ...]],
+    mask: int,
+    users_groups: UsersGroups,
+    encoding: StateEncoding,
+) -> List[Mapping[str, str | Wildcard | Options]]:
+    """
+    Splits the combinations selected by mask into per user options. A joint
+    component doesn't always split into a single product of per user options
+    so this can return several
+    """
+    if mask == (1 << len(domain)) - 1:
+        return [{name: Wildcard() for name in names}]
+
+    columns = []
+    for i, name in enumerate(names):
+        states = sorted({states[i] for states in domain})
+        if name in users_groups.users:
+            labels = [encoding.decode_single(s) for s in states]
+        else:
+            labels = [encoding.serialize(s) for s in states]
+        columns.append((states, labels))
+
+    cubes = [
+        tuple(1 << column.index(s) for (column, _), s in zip(columns, domain[b]))
+        for b in _bits(mask)
+    ]
+    out = []
+    for cube in merge(cubes):
+        out.append(
+            {
+                name: _render_values(labels, (1 << len(states)) - 1, value)
+                for name, (states, labels), value in zip(names, columns, cube)
+            }
+        )
+    return out
+
+
+def render(
+    space: CubeSpace, cubes: Sequence[Cube], config: Config
+) -> Iterator[MatchResult]:
+    users_groups = config.users_groups
+    encoding = config.settings.state_encoding
+    for cube in cubes:
+        room, occupancy = cube[0], cube[1]
+        user_options = [
+            _render_component(names, domain, mask, users_groups, encoding)
+            for names, domain, mask in zip(
+                space.components, space.component_domains, cube[2:]
+            )
+        ]
+        for parts in itertools.product(*user_options):
+            user_state: Dict[str, str | Wildcard | Options] = {}
+            for part in parts:
+                user_state.update(part)
+            yield MatchResult(
+                room=_render_values(
+                    space.room_states, (1 << len(space.room_states)) - 1, room
+                ),
+                occupancy=_render_values(
+                    space.occupancy_states,
+                    (1 << len(space.occupancy_states)) - 1,
+                    occupancy,
+                ),
+                user_state=user_state,
+                rule_name=None,
+            )
+
+
+def unassigned_cubes(group: LightGroup, config: Config) -> Tuple[CubeSpace, List[Cube]]:
+    space = CubeSpace.for_light_group(group, config)
+    rule_cubes = [space.rule_cube(rule) for rule in group.rules]
+    remaining = uncovered(space.universe(), rule_cubes)
+    return space, minimize(remaining, space.sizes, rule_cubes)
+
+
+def symbolic_unassigned(group: LightGroup, config: Config) -> Iterator[MatchResult]:
+    """
+    The states no rule of the group matches as a small set of patterns
+    """
+    space, cubes = unassigned_cubes(group, config)
+    return render(space, cubes, config)
+
+
+@dataclass
+class DeadRule:
+    index: int
+    rule: LightRule
+
+    # The earlier rules that overlap this one. Empty if the rule can't match
+    # anything at all
+    shadowed_by: List[LightRule]
+
+
+def dead_rules(
+    group: LightGroup, config: Config, include_unknown: bool = False
+) -> List[DeadRule]:
+    """
+    Rules that never win first-match, either because they can't match any state
+    or because the rules before them already match everything they do. With
+    include_unknown states that aren't configured are considered too, so the
+    rules returned can be dropped without changing which rule wins for any state
+    """
+    space = CubeSpace.for_light_group(group, config, include_unknown)
+    rule_cubes = [space.rule_cube(rule) for rule in group.rules]
+
+    out: List[DeadRule] = []
+    live: List[int] = []
+    for i, (rule, cube) in enumerate(zip(group.rules, rule_cubes)):
+        if uncovered(cube, rule_cubes[:i]):
+            live.append(i)
+            continue
+        out.append(
+            DeadRule(
+                index=i,
+                rule=rule,
+                shadowed_by=[
+                    group.rules[j]
+                    for j in live
+                    if all(cube) and _intersects(cube, rule_cubes[j])
+                ],
+            )
+        )
+    return out
+
+
+def prune_dead_rules(config: Config) -> None:
+    """
+    Drops the rules of every light group that can never win for any state, known
+    or not, so they aren't evaluated at runtime
+    """
+    for group in config.lights.values():
+        dead = dead_rules(group, config, include_unknown=True)
+        if dead:
+            _LOGGER.info(
+                f"Dropping rules from {group.name} that can never match: "
+                f"{', '.join(d.rule.state_name for d in dead)}"
+            )
+            group.prune_rules({d.index for d in dead})
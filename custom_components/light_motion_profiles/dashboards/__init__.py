@@ -15,11 +15,24 @@ from ..lovelace import (
 )
 
 from ..datatypes import Config, UsersGroups
+from ..datatypes.entity import Domain
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _published(entities: Sequence[str | Dict[str, str]]) -> List[str | Dict[str, str]]:
+    """
+    Drops the entities kept internal to the integration, hass has no state for them
+    """
+    internal = f"{Domain.INTERNAL.value}."
+    return [
+        e
+        for e in entities
+        if not (e[ENTITY] if isinstance(e, dict) else e).startswith(internal)
+    ]
+
+
 class PresenceDebugDashboard(GeneratedDashboard):
     def __init__(self, config: UsersGroups) -> None:
         self._ug_config = config
@@ -39,7 +52,7 @@ class PresenceDebugDashboard(GeneratedDashboard):
         for name, group in self._ug_config.groups.items():
             entities.append(group.presence_entity.full)
 
-        return EntitiesCard(entities, title="User and Group presence")
+        return EntitiesCard(_published(entities), title="User and Group presence")
 
     def _build_per_user_overrides(self) -> Renderable:
         cards: List[Renderable] = []
@@ -71,7 +84,8 @@ class PresenceDebugDashboard(GeneratedDashboard):
 
             cards.append(
                 EntitiesCard(
-                    title=name.replace("_", " ").capitalize(), entities=entities
+                    title=name.replace("_", " ").capitalize(),
+                    entities=_published(entities),
                 )
             )
 
@@ -162,10 +176,12 @@ class MotionDebugDashboard(GeneratedDashboard):
                         ENTITY: config.occupancy_sensors.entity,
                     }
                 )
-            bindings.append(EntitiesCard(title=name, entities=entities))
+            bindings.append(EntitiesCard(title=name, entities=_published(entities)))
 
         cards: Sequence[Renderable] = [
-            EntitiesCard(entities=light_automation, title="Light Automation States")
+            EntitiesCard(
+                entities=_published(light_automation), title="Light Automation States"
+            )
         ] + bindings
         return VerticalStackCard(cards=cards)
 
@@ -14,11 +14,13 @@ from ..config.settings import (
     UserGroupSettings as UserGroupSettings,
     DashboardSettings as DashboardSettings,
     KillswitchSettings as KillswitchSettings,
+    MeshSettings as MeshSettings,
 )
 
 from .entity import InputEntity, Domains as Domains, Entity as Entity
 from .match import RuleMatch
 from .source import DataSource
+from .states import StateEncoding as StateEncoding
 
 
 class Settings:
@@ -26,6 +28,13 @@ class Settings:
     users_groups: UserGroupSettings
     dashboard: DashboardSettings | None
     killswitch: KillswitchSettings
+    state_encoding: StateEncoding
+    update_debounce: float
+    meshes: Mapping[str, MeshSettings]
+    reconcile_interval: float
+    reconcile_batch_size: int
+    motion_fast_path: bool
+    internal_entities: Set[str]
 
     def __init__(self, config: RawAllSettings, domains: Domains):
         self.domains = domains
@@ -33,6 +42,15 @@ class Settings:
         self.users_groups = config.users_groups
         self.dashboard = config.dashboard
         self.killswitch = config.killswitch
+        self.update_debounce = config.update_debounce
+        self.meshes = config.meshes
+        self.reconcile_interval = config.reconcile_interval
+        self.reconcile_batch_size = config.reconcile_batch_size
+        self.motion_fast_path = config.motion_fast_path
+        self.internal_entities = config.internal_entities
+        self.state_encoding = StateEncoding(
+            self.users_groups.valid_person_states, self.users_groups.absent_state
+        )
 
 
 @dataclass
@@ -83,7 +101,10 @@ class LightRule:
         self.state_name = config.state_name
         self.state = light_profiles[config.light_profile]
         self.rule_match = RuleMatch(
-            config.room_state, config.occupancy, config.user_state
+            config.room_state,
+            config.occupancy,
+            config.user_state,
+            settings.state_encoding,
         )
 
 
@@ -133,6 +154,12 @@ class LightGroup:
                 f"'{self.user}' listed in the rule definition"
             )
 
+    def prune_rules(self, indexes: Set[int]) -> None:
+        """
+        Drops rules (eg ones that can never match) so they are never evaluated
+        """
+        self.rules = [r for i, r in enumerate(self.rules) if i not in indexes]
+
     def get_rule_users(self) -> Set[str]:
         out = set()
         for rule in self.rules:
@@ -258,16 +285,17 @@ class Group:
 
     @classmethod
     def resolve_group_states(
-        cls, input_states: Iterator[str | Set[str]], absent_state: str
-    ) -> Set[str]:
-        states = set()
+        cls, input_states: Iterator[int], absent_state: int
+    ) -> int:
+        """
+        Combines the state masks of all the members of a group. Absent is only
+        kept if it's the only state any member is in
+        """
+        states = 0
         for state in input_states:
-            if isinstance(state, set):
-                states.update(state)
-            else:
-                states.add(state)
-        if len(states) != 1:
-            states.discard(absent_state)
+            states |= state
+        if states & (states - 1):
+            states &= ~absent_state
         return states
 
 
@@ -388,6 +416,19 @@ class Config:
             for name, light_config in raw_config.light_configs.items()
         }
 
+    def mesh_queue_entity(self, mesh: str) -> Entity:
+        return Entity(
+            domain=self.settings.domains.mesh_queue,
+            name=f"light_mesh_queue_{mesh}",
+        )
+
+    @property
+    def reconciler_entity(self) -> Entity:
+        return Entity(
+            domain=self.settings.domains.reconciler,
+            name="light_reconciler",
+        )
+
     @property
     def global_killswitch_entity(self) -> Entity:
         return Entity(
@@ -7,6 +7,8 @@ class Domain(Enum):
     SELECT = "select"
     SWITCH = "switch"
     BINARY_SENSOR = "binary_sensor"
+    # Kept as a value inside the integration, never added to hass
+    INTERNAL = "internal"
 
 
 @dataclass
@@ -51,6 +53,12 @@ class Domains:
     # This entity represents the final profile that is currently applied to the light
     light_automation: Domain
 
+    # This entity holds the number of light commands waiting to be sent to a mesh
+    mesh_queue: Domain
+
+    # This entity holds the counts of lights found not in the state they were sent
+    reconciler: Domain
+
 
 @dataclass
 class InputEntity:
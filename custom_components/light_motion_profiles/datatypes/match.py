@@ -4,6 +4,7 @@ from typing import List, Set, Mapping
 
 from ..config.validators import InvalidConfigError
 from ..config.light_profiles import Match as RawMatch, UserState as RawUserState
+from .states import StateEncoding
 
 
 class MatchError(Exception):
@@ -15,6 +16,10 @@ class MatchSingle(ABC):
     def match(self, target_value: str) -> bool:
         pass
 
+    @abstractmethod
+    def mask(self, encoding: StateEncoding) -> int:
+        pass
+
     @classmethod
     def from_raw(cls, m: RawMatch) -> "MatchSingle":
         if isinstance(m.value, set):
@@ -32,11 +37,17 @@ class MatchSingleExplicit(MatchSingle):
     def match(self, target_value: str) -> bool:
         return self.value == target_value
 
+    def mask(self, encoding: StateEncoding) -> int:
+        return encoding.bit(self.value)
+
 
 class MatchSingleWildcard(MatchSingle):
     def match(self, target_value: str) -> bool:
         return True
 
+    def mask(self, encoding: StateEncoding) -> int:
+        return StateEncoding.ALL
+
 
 class MatchSingleAny(MatchSingle):
     def __init__(self, value: Set[str]):
@@ -45,68 +56,69 @@ class MatchSingleAny(MatchSingle):
     def match(self, target_value: str) -> bool:
         return target_value in self.value
 
+    def mask(self, encoding: StateEncoding) -> int:
+        return encoding.encode(self.value)
+
 
 class MatchMulti(ABC):
-    def __init__(self, match: MatchSingle):
+    """
+    Matches the states of a user or group. The states are a mask from
+    StateEncoding where a user has a single bit set and a group has one bit
+    for every state its members are in
+    """
+
+    def __init__(self, match: MatchSingle, encoding: StateEncoding):
         self._match = match
+        self._mask = match.mask(encoding)
+
+    @property
+    def single(self) -> MatchSingle:
+        return self._match
+
+    @property
+    def mask(self) -> int:
+        return self._mask
 
     @abstractmethod
-    def match(self, target_values: str | Set[str]) -> bool:
+    def match(self, target_values: int) -> bool:
         pass
 
 
 class MatchMultiAny(MatchMulti):
-    def match(self, target_values: str | Set[str]) -> bool:
-        if isinstance(target_values, str):
-            return self._match.match(target_values)
-        else:
-            return any(self._match.match(v) for v in target_values)
+    def match(self, target_values: int) -> bool:
+        return target_values & self._mask != 0
 
 
 class MatchMultiAll(MatchMulti):
-    def match(self, target_values: str | Set[str]) -> bool:
-        if isinstance(target_values, str):
-            return self._match.match(target_values)
-        else:
-            return all(self._match.match(v) for v in target_values)
+    def match(self, target_values: int) -> bool:
+        return target_values & self._mask == target_values
 
 
 class MatchMultiExact(MatchMulti):
-    def match(self, target_values: str | Set[str]) -> bool:
+    def __init__(self, match: MatchSingle, encoding: StateEncoding):
+        super().__init__(match, encoding)
         # Wildcards are never exact matches
-        if isinstance(self._match, MatchSingleWildcard):
-            return False
+        self._never = isinstance(match, MatchSingleWildcard)
 
-        if isinstance(target_values, str):
-            target_values = {target_values}
-
-        if isinstance(self._match, MatchSingleAny):
-            options = self._match.value
-        elif isinstance(self._match, MatchSingleExplicit):
-            options = {self._match.value}
-        else:
-            raise NotImplementedError(
-                f"Unknown type of match found '{type(self._match).__name__}'"
-            )
-
-        return options == target_values
+    def match(self, target_values: int) -> bool:
+        return not self._never and target_values == self._mask
 
 
 @dataclass
 class MatchUser(ABC):
     @abstractmethod
-    def match(self, all_users_states: Mapping[str, str | Set[str]]) -> bool:
+    def match(self, all_users_states: Mapping[str, int]) -> bool:
         pass
 
     @classmethod
-    def from_raw(cls, config: RawUserState) -> "MatchUser":
+    def from_raw(cls, config: RawUserState, encoding: StateEncoding) -> "MatchUser":
         multi: MatchMulti
         if config.state_any is not None:
-            multi = MatchMultiAny(MatchSingle.from_raw(config.state_any))
+            multi = MatchMultiAny(MatchSingle.from_raw(config.state_any), encoding)
         elif config.state_all is not None:
-            multi = MatchMultiAll(MatchSingle.from_raw(config.state_all))
+            multi = MatchMultiAll(MatchSingle.from_raw(config.state_all), encoding)
         elif config.state_exact is not None:
-            multi = MatchMultiExact(MatchSingle.from_raw(config.state_exact))
+            multi = MatchMultiExact(MatchSingle.from_raw(config.state_exact), encoding)
 
         return MatchUserSingle(
             user=config.user,
@@ -119,7 +131,7 @@ class MatchUserSingle(MatchUser):
     user: str
     match_multi: MatchMulti
 
-    def match(self, all_users_states: Mapping[str, str | Set[str]]) -> bool:
+    def match(self, all_users_states: Mapping[str, int]) -> bool:
         user_state = all_users_states.get(self.user)
         if user_state is None:
             raise MatchError(f"Did not receive user state for user {self.user}")
@@ -130,7 +142,7 @@ class MatchUserWildcard(MatchUser):
     def __init__(self) -> None:
         pass
 
-    def match(self, all_users_states: Mapping[str, str | Set[str]]) -> bool:
+    def match(self, all_users_states: Mapping[str, int]) -> bool:
         return True
 
 
@@ -145,6 +157,7 @@ class RuleMatch:
         room_state: RawMatch,
         occupancy: RawMatch,
         user_state: List[RawUserState] | RawMatch,
+        encoding: StateEncoding,
     ) -> None:
         self.room_state = MatchSingle.from_raw(room_state)
         self.occupancy = MatchSingle.from_raw(occupancy)
@@ -158,20 +171,25 @@ class RuleMatch:
                 )
             self.user_state = [MatchUserWildcard()]
         else:
-            self.user_state = [MatchUser.from_raw(us) for us in user_state]
+            self.user_state = [MatchUser.from_raw(us, encoding) for us in user_state]
 
     def match(
         self,
         room_state: str,
         occupancy_state: str,
-        user_state: Mapping[str, str | Set[str]],
+        user_state: Mapping[str, int],
     ) -> bool:
-        if not self.room_state.match(room_state):
+        if not self.match_room(room_state, occupancy_state):
             return False
 
-        if not self.occupancy.match(occupancy_state):
-            return False
+        return self.match_users(user_state)
+
+    def match_room(self, room_state: str, occupancy_state: str) -> bool:
+        return self.room_state.match(room_state) and self.occupancy.match(
+            occupancy_state
+        )
 
+    def match_users(self, user_state: Mapping[str, int]) -> bool:
         return all(s.match(user_state) for s in self.user_state)
 
     def get_users(self) -> Set[str]:
@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List, Set
+
+
+GROUP_SEPARATOR = ","
+
+
+class StateEncoding:
+    """
+    Interns person states into bit positions so the state of a user or a group
+    can be passed around and matched as a single int mask rather than a set of
+    strings. States that were not known up front (eg "unknown" coming from the
+    state machine) are given a new bit the first time they are seen.
+    """
+
+    # A mask that contains every state, including ones interned later
+    ALL = -1
+
+    def __init__(self, person_states: Iterable[str], absent_state: str) -> None:
+        self._bits: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._serialized: Dict[int, str] = {}
+        self._deserialized: Dict[str, int] = {}
+
+        self.person_states = [self.bit(s) for s in sorted(person_states)]
+        self.absent = self.bit(absent_state)
+
+    @property
+    def states(self) -> List[str]:
+        """
+        Every interned state, states[i] is the state for bit 1 << i
+        """
+        return list(self._names)
+
+    def bit(self, state: str) -> int:
+        bit = self._bits.get(state)
+        if bit is None:
+            bit = 1 << len(self._names)
+            self._bits[state] = bit
+            self._names.append(state)
+        return bit
+
+    def encode(self, states: str | Iterable[str]) -> int:
+        if isinstance(states, str):
+            return self.bit(states)
+
+        mask = 0
+        for state in states:
+            mask |= self.bit(state)
+        return mask
+
+    def decode(self, mask: int) -> Set[str]:
+        return {name for i, name in enumerate(self._names) if mask & (1 << i)}
+
+    def decode_single(self, mask: int) -> str:
+        assert mask and not mask & (mask - 1), f"Expected a single state: {mask}"
+        return self._names[mask.bit_length() - 1]
+
+    def serialize(self, mask: int) -> str:
+        value = self._serialized.get(mask)
+        if value is None:
+            value = GROUP_SEPARATOR.join(sorted(self.decode(mask)))
+            self._serialized[mask] = value
+        return value
+
+    def deserialize(self, value: str) -> int:
+        mask = self._deserialized.get(value)
+        if mask is None:
+            mask = self.encode(value.split(GROUP_SEPARATOR))
+            self._deserialized[value] = mask
+        return mask
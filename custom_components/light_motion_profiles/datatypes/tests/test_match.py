@@ -0,0 +1,108 @@
+import itertools
+import unittest
+
+from ...config.light_profiles import Match
+from ..match import (
+    MatchSingle,
+    MatchMultiAny,
+    MatchMultiAll,
+    MatchMultiExact,
+)
+from ..states import StateEncoding
+from .. import Group
+
+
+STATES = ["awake", "winddown", "asleep"]
+ABSENT = "absent"
+
+
+def all_subsets(values):
+    for size in range(1, len(values) + 1):
+        for subset in itertools.combinations(values, size):
+            yield set(subset)
+
+
+class TestStateEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        encoding = StateEncoding(STATES, ABSENT)
+        for subset in all_subsets(STATES + [ABSENT]):
+            mask = encoding.encode(subset)
+            self.assertEqual(encoding.decode(mask), subset)
+            value = encoding.serialize(mask)
+            self.assertEqual(value, ",".join(sorted(subset)))
+            self.assertEqual(encoding.deserialize(value), mask)
+
+        self.assertEqual(encoding.decode_single(encoding.bit("asleep")), "asleep")
+
+    def test_unknown_states(self):
+        encoding = StateEncoding(STATES, ABSENT)
+        unknown = encoding.deserialize("unknown")
+        self.assertNotIn(unknown, encoding.person_states + [encoding.absent])
+        self.assertEqual(encoding.serialize(unknown), "unknown")
+
+    def test_resolve_group_states(self):
+        encoding = StateEncoding(STATES, ABSENT)
+        absent = encoding.absent
+        awake = encoding.bit("awake")
+        asleep = encoding.bit("asleep")
+
+        def resolve(*states):
+            return Group.resolve_group_states(iter(states), absent)
+
+        self.assertEqual(resolve(absent, absent), absent)
+        self.assertEqual(resolve(absent, awake), awake)
+        self.assertEqual(resolve(awake | absent, asleep), awake | asleep)
+        self.assertEqual(resolve(awake, awake), awake)
+
+    def test_resolve_nested_groups_flattened(self):
+        """
+        Combining a group's users directly gives the same state as combining
+        its nested groups first
+        """
+        encoding = StateEncoding(STATES, ABSENT)
+        masks = encoding.person_states + [encoding.absent]
+
+        def resolve(states):
+            return Group.resolve_group_states(iter(states), encoding.absent)
+
+        for users in itertools.product(masks, repeat=4):
+            nested = resolve([resolve(users[:2]), resolve(users[2:3]), users[3]])
+            self.assertEqual(nested, resolve(users))
+
+
+class TestMatchMulti(unittest.TestCase):
+    def test_against_sets(self):
+        """
+        Compare the mask matching against the plain set definitions for every
+        combination of target and match values
+        """
+        encoding = StateEncoding(STATES, ABSENT)
+        options = STATES + [ABSENT, "unknown"]
+        values = [Match("*")] + [
+            Match(s.pop() if len(s) == 1 else s) for s in all_subsets(options)
+        ]
+
+        for value in values:
+            single = MatchSingle.from_raw(value)
+            match_any = MatchMultiAny(single, encoding)
+            match_all = MatchMultiAll(single, encoding)
+            match_exact = MatchMultiExact(single, encoding)
+            for target in all_subsets(options):
+                mask = encoding.encode(target)
+                self.assertEqual(
+                    match_any.match(mask), any(single.match(t) for t in target)
+                )
+                self.assertEqual(
+                    match_all.match(mask), all(single.match(t) for t in target)
+                )
+                if value.value == "*":
+                    expected = False
+                elif isinstance(value.value, set):
+                    expected = value.value == target
+                else:
+                    expected = {value.value} == target
+                self.assertEqual(match_exact.match(mask), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,35 @@
+import functools
 import itertools
+import math
+import operator
 from dataclasses import dataclass
-from typing import Iterator, Set, Mapping, List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Iterator,
+    Set,
+    Mapping,
+    List,
+    Dict,
+    Tuple,
+    Sequence,
+    FrozenSet,
+    TypeVar,
+)
 
-from .datatypes import Config, LightGroup, UsersGroups, User, Group
+from .datatypes import (
+    Config,
+    LightGroup,
+    LightRule,
+    UsersGroups,
+    User,
+    Group,
+    StateEncoding,
+)
+
+# Used as the rule index for states that no rule matches
+UNASSIGNED = -1
+
+T = TypeVar("T")
 
 
 class Wildcard:
@@ -21,23 +48,26 @@ class MatchResult:
     user_state: Mapping[str, str | Set[str] | Wildcard | Options]
     rule_name: str | None
 
+    @staticmethod
+    def _format_value(raw_value: str | Set[str] | Wildcard | Options) -> str:
+        if isinstance(raw_value, str):
+            return raw_value
+        elif isinstance(raw_value, set):
+            return ",".join(raw_value)
+        elif isinstance(raw_value, Wildcard):
+            return "*"
+        elif isinstance(raw_value, Options):
+            return "|".join(raw_value.options)
+        else:
+            raise ValueError(f"Got unexpected raw_value: '{raw_value}'")
+
     def to_tabulate(self) -> Dict[str, str]:
         out = {
-            "room_state": str(self.room),
-            "occupancy": str(self.occupancy),
+            "room_state": self._format_value(self.room),
+            "occupancy": self._format_value(self.occupancy),
         }
         for user, raw_value in sorted(self.user_state.items()):
-            if isinstance(raw_value, str):
-                value = raw_value
-            elif isinstance(raw_value, set):
-                value = ",".join(raw_value)
-            elif isinstance(raw_value, Wildcard):
-                value = "*"
-            elif isinstance(raw_value, Options):
-                value = "|".join(raw_value.options)
-            else:
-                raise ValueError(f"Got unexpected raw_value: '{raw_value}'")
-            out[f"user: {user}"] = value
+            out[f"user: {user}"] = self._format_value(raw_value)
         out["rule_name"] = self.rule_name if self.rule_name else "UNASSIGNED!"
         return out
 
@@ -47,20 +77,20 @@ class UserCombinator:
     # A list of all users/groups
     users_groups: UsersGroups
 
-    # All the possible states a single user can be in
-    single_person_states: Set[str]
+    # All the possible states a single user can be in as StateEncoding masks
+    single_person_states: List[int]
 
-    absent_state: str
+    absent_state: int
 
     def combinations_for_people(
         self, people_map: Mapping[str, User]
-    ) -> Iterator[Dict[str, str | Set[str]]]:
-        all_states = self.single_person_states | {self.absent_state}
+    ) -> Iterator[Dict[str, int]]:
+        all_states = self.single_person_states + [self.absent_state]
         people = list(people_map)
         for options in itertools.product(all_states, repeat=len(people)):
             yield dict(zip(people, options))
 
-    def resolve_groups(self, target: Group, states: Dict[str, str | Set[str]]) -> None:
+    def resolve_groups(self, target: Group, states: Dict[str, int]) -> None:
         member_states = []
         for member in target.members:
             if member in self.users_groups.groups:
@@ -74,7 +104,7 @@ class UserCombinator:
 
     def combinations_for_target(
         self, target: User | Group
-    ) -> Iterator[Mapping[str, str | Set[str]]]:
+    ) -> Iterator[Mapping[str, int]]:
         # First we fetch all the people involved here recursively which may
         # just be 1 person
         all_users = self.users_groups.members(target.name)
@@ -87,58 +117,310 @@ class UserCombinator:
             yield combination
 
 
-def calculate_key(values: Mapping[str, str | Set[str]]) -> str:
-    out = []
-    for user, value in values.items():
-        if isinstance(value, set):
-            out.append(",".join(sorted(value)))
+@dataclass
+class RuleUserDomains:
+    """
+    Enumerates every distinct combination of states for the users/groups that
+    a light group's rules reference, without going through every combination
+    of the people underneath them like UserCombinator does.
+
+    Rule users that don't share any people are independent so each one only
+    needs its own domain of reachable states: a single state for a user, or
+    for a group of n people absent plus every set of up to n other states.
+    Rule users that do share people (eg a user and a group containing them)
+    are enumerated together from the blocks of people they share.
+    """
+
+    users_groups: UsersGroups
+
+    # All the possible states a single user can be in as StateEncoding masks
+    single_person_states: List[int]
+
+    absent_state: int
+
+    @classmethod
+    def from_config(cls, config: Config) -> "RuleUserDomains":
+        encoding = config.settings.state_encoding
+        return cls(
+            users_groups=config.users_groups,
+            single_person_states=encoding.person_states,
+            absent_state=encoding.absent,
+        )
+
+    def user_domain(self) -> List[int]:
+        return self.single_person_states + [self.absent_state]
+
+    def group_domain(self, size: int) -> List[int]:
+        """
+        All the states Group.resolve_group_states can produce for a group with
+        `size` people in it. Absent only survives when everyone is absent
+        """
+        if size == 0:
+            return [0]
+
+        out = []
+        for count in range(1, min(size, len(self.single_person_states)) + 1):
+            for states in itertools.combinations(self.single_person_states, count):
+                out.append(functools.reduce(operator.or_, states))
+        out.append(self.absent_state)
+        return out
+
+    def components(self, rule_users: Set[str]) -> List[List[str]]:
+        """
+        Splits the rule users into sets that have people in common
+        """
+        components: List[Tuple[List[str], Set[str]]] = []
+        for name in sorted(rule_users):
+            names = [name]
+            people = set(self.users_groups.members(name))
+            disjoint = []
+            for other_names, other_people in components:
+                if other_people & people:
+                    names += other_names
+                    people |= other_people
+                else:
+                    disjoint.append((other_names, other_people))
+            components = disjoint + [(sorted(names), people)]
+        return sorted(names for names, _ in components)
+
+    def component_domain(self, names: List[str]) -> List[Tuple[int, ...]]:
+        if len(names) == 1:
+            name = names[0]
+            if name in self.users_groups.users:
+                return [(state,) for state in self.user_domain()]
+            else:
+                size = len(self.users_groups.members(name))
+                return [(state,) for state in self.group_domain(size)]
+
+        # Split the people into blocks that are in exactly the same rule
+        # users/groups. Each block can be treated as a single group as only the
+        # union of its states is visible through the groups containing it
+        members = {name: set(self.users_groups.members(name)) for name in names}
+        blocks: Dict[FrozenSet[str], int] = {}
+        for person in set().union(*members.values()):
+            key = frozenset(n for n, people in members.items() if person in people)
+            blocks[key] = blocks.get(key, 0) + 1
+
+        block_keys = sorted(blocks, key=sorted)
+        block_domains = []
+        for key in block_keys:
+            if len(key) == 1 and next(iter(key)) in self.users_groups.users:
+                block_domains.append(self.user_domain())
+            else:
+                block_domains.append(self.group_domain(blocks[key]))
+
+        # Different blocks can produce the same visible states so these still
+        # need deduping, but only within this (usually tiny) component
+        out = []
+        seen = set()
+        for block_states in itertools.product(*block_domains):
+            states = tuple(
+                Group.resolve_group_states(
+                    (s for k, s in zip(block_keys, block_states) if name in k),
+                    self.absent_state,
+                )
+                for name in names
+            )
+            if states not in seen:
+                seen.add(states)
+                out.append(states)
+        return out
+
+    def combination_count(self, rule_users: Set[str]) -> int:
+        return math.prod(
+            len(self.component_domain(names)) for names in self.components(rule_users)
+        )
+
+    def combinations_for_rule_users(
+        self, rule_users: Set[str], start: int = 0, stop: int | None = None
+    ) -> Iterator[Dict[str, int]]:
+        """
+        Yields the combinations in itertools.product order. start/stop select an
+        index range of that order so the space can be split into chunks
+        """
+        components = self.components(rule_users)
+        domains = [self.component_domain(names) for names in components]
+        if start == 0 and stop is None:
+            options_iter: Iterator[Tuple[Tuple[int, ...], ...]] = itertools.product(
+                *domains
+            )
+        else:
+            options_iter = product_range(domains, start, stop)
+
+        for options in options_iter:
+            combination = {}
+            for names, states in zip(components, options):
+                combination.update(zip(names, states))
+            yield combination
+
+
+def product_range(
+    domains: List[List[T]], start: int, stop: int | None = None
+) -> Iterator[Tuple[T, ...]]:
+    """
+    The same as itertools.islice(itertools.product(*domains), start, stop) but
+    jumps straight to start rather than generating everything before it
+    """
+    total = math.prod(len(domain) for domain in domains)
+    stop = total if stop is None else min(stop, total)
+    if start >= stop:
+        return
+
+    # Mixed radix digits of start, the last domain changes fastest
+    digits = []
+    remainder = start
+    for domain in reversed(domains):
+        remainder, digit = divmod(remainder, len(domain))
+        digits.append(digit)
+    digits.reverse()
+
+    for _ in range(stop - start):
+        yield tuple(domain[digit] for domain, digit in zip(domains, digits))
+        for i in reversed(range(len(digits))):
+            digits[i] += 1
+            if digits[i] < len(domains[i]):
+                break
+            digits[i] = 0
+
+
+@dataclass
+class RuleEvaluator:
+    """
+    Evaluates first-match for every (room_state, occupancy) cell of a light group
+    at once. The room/occupancy half of every rule only depends on the cell so
+    it's computed once up front as a bitmask of cells, leaving just the user
+    half of each rule to be checked for each combination of user states
+    """
+
+    # Every (room_state, occupancy) pair, bit i of a cell mask refers to cells[i]
+    cells: List[Tuple[str, str]]
+
+    rules: List[LightRule]
+
+    # The cells each rule's room_state/occupancy matches
+    rule_cells: List[int]
+
+    @classmethod
+    def for_light_group(
+        cls, group: LightGroup, room_states: List[str], occupancy_states: List[str]
+    ) -> "RuleEvaluator":
+        cells = [(room, occ) for room in room_states for occ in occupancy_states]
+        rule_cells = []
+        for rule in group.rules:
+            mask = 0
+            for i, (room, occupancy) in enumerate(cells):
+                if rule.rule_match.match_room(room, occupancy):
+                    mask |= 1 << i
+            rule_cells.append(mask)
+        return cls(cells=cells, rules=group.rules, rule_cells=rule_cells)
+
+    def first_matches(self, user_state: Mapping[str, int]) -> List[int]:
+        """
+        Returns the index of the first matching rule (or UNASSIGNED) for each cell
+        """
+        matched = [UNASSIGNED] * len(self.cells)
+        remaining = (1 << len(self.cells)) - 1
+        for index, (rule, cells) in enumerate(zip(self.rules, self.rule_cells)):
+            hits = cells & remaining
+            if not hits or not rule.rule_match.match_users(user_state):
+                continue
+            remaining ^= hits
+            while hits:
+                lowest = hits & -hits
+                matched[lowest.bit_length() - 1] = index
+                hits ^= lowest
+            if not remaining:
+                break
+        return matched
+
+    def cell_rules(self, cell: int) -> List[int]:
+        """
+        The indexes of the rules whose room_state/occupancy match cells[cell]
+        """
+        return [i for i, cells in enumerate(self.rule_cells) if cells >> cell & 1]
+
+
+def decode_user_states(
+    user_states: Mapping[str, int], users_groups: UsersGroups, encoding: StateEncoding
+) -> Dict[str, str | Set[str]]:
+    out: Dict[str, str | Set[str]] = {}
+    for name, mask in user_states.items():
+        if name in users_groups.users:
+            out[name] = encoding.decode_single(mask)
         else:
-            out.append(value)
-    return ":".join(out)
+            out[name] = encoding.decode(mask)
+    return out
+
+
+def cell_states(config: Config) -> Tuple[List[str], List[str]]:
+    room_states = sorted(list(config.settings.room.valid_room_states))
+    occupancy_states = sorted(config.settings.room.occupancy_states.all_states())
+    return room_states, occupancy_states
 
 
 def gen_light_group_matches(
     group: LightGroup,
     config: Config,
 ) -> Iterator[MatchResult]:
-    room_states = sorted(list(config.settings.room.valid_room_states))
-    occupancy_states = sorted(config.settings.room.occupancy_states.all_states())
+    room_states, occupancy_states = cell_states(config)
     users_groups = config.users_groups
+    encoding = config.settings.state_encoding
+    domains = RuleUserDomains.from_config(config)
 
-    target = users_groups.get(group.user)
-    rule_users = list(sorted(group.get_rule_users()))
+    evaluator = RuleEvaluator.for_light_group(group, room_states, occupancy_states)
+    for user_state in domains.combinations_for_rule_users(group.get_rule_users()):
+        decoded_user_state = decode_user_states(user_state, users_groups, encoding)
+        matches = evaluator.first_matches(user_state)
+        for (room_state, occupancy_state), matched in zip(evaluator.cells, matches):
+            yield MatchResult(
+                room=room_state,
+                occupancy=occupancy_state,
+                user_state=decoded_user_state,
+                rule_name=(
+                    None if matched == UNASSIGNED else group.rules[matched].state_name
+                ),
+            )
 
-    combinator = UserCombinator(
-        users_groups=config.users_groups,
-        single_person_states=set(config.settings.users_groups.valid_person_states),
-        absent_state=config.settings.users_groups.absent_state,
-    )
 
-    seen = set()
-    for user_state in combinator.combinations_for_target(target):
-        filtered_user_state = {k: v for k, v in user_state.items() if k in rule_users}
-        key = calculate_key(filtered_user_state)
-        if key in seen:
-            continue
-        seen.add(key)
-        for room_state in room_states:
-            for occupancy_state in occupancy_states:
-                matched = None
-                for rule in group.rules:
-                    if rule.rule_match.match(
-                        room_state, occupancy_state, filtered_user_state
-                    ):
-                        matched = rule.state_name
-                        break
-                yield MatchResult(
-                    room=room_state,
-                    occupancy=occupancy_state,
-                    user_state=filtered_user_state,
-                    rule_name=matched,
-                )
+def gen_light_group_matches_by_cell(
+    group: LightGroup,
+    config: Config,
+) -> Iterator[MatchResult]:
+    """
+    The same rows as gen_light_group_matches but ordered by (room, occupancy) and
+    then user states. The user state combinations are re-enumerated for each cell
+    so rows come out already sorted without holding the table in memory
+    """
+    room_states, occupancy_states = cell_states(config)
+    users_groups = config.users_groups
+    encoding = config.settings.state_encoding
+    domains = RuleUserDomains.from_config(config)
+    rule_users = group.get_rule_users()
+
+    evaluator = RuleEvaluator.for_light_group(group, room_states, occupancy_states)
+    for cell, (room_state, occupancy_state) in enumerate(evaluator.cells):
+        rules = [group.rules[i] for i in evaluator.cell_rules(cell)]
+        for user_state in domains.combinations_for_rule_users(rule_users):
+            rule_name = None
+            for rule in rules:
+                if rule.rule_match.match_users(user_state):
+                    rule_name = rule.state_name
+                    break
+            yield MatchResult(
+                room=room_state,
+                occupancy=occupancy_state,
+                user_state=decode_user_states(user_state, users_groups, encoding),
+                rule_name=rule_name,
+            )
+
 
+def build_ranges(config: Config, jobs: int = 1) -> Mapping[str, List[MatchResult]]:
+    if jobs > 1:
+        return {
+            name: list(table.rows(config))
+            for name, table in build_truth_tables(config, jobs=jobs).items()
+        }
 
-def build_ranges(config: Config) -> Mapping[str, List[MatchResult]]:
     out = {}
     for name, group in config.lights.items():
         out[name] = list(
@@ -148,3 +430,247 @@ def build_ranges(config: Config) -> Mapping[str, List[MatchResult]]:
             )
         )
     return out
+
+
+@dataclass
+class TruthTable:
+    """
+    The same rows as gen_light_group_matches stored as columns. Row i is the
+    room_states[room[i]] and occupancy_states[occupancy[i]] cell with the masks
+    user_states[u][i] for every rule user u, won by rule_names[rule[i]] (or
+    UNASSIGNED). The columns are lists or numpy arrays depending on the backend
+    that built the table
+    """
+
+    room_states: List[str]
+    occupancy_states: List[str]
+    users: List[str]
+    rule_names: List[str]
+
+    room: Sequence[int]
+    occupancy: Sequence[int]
+    user_states: List[Sequence[int]]
+    rule: Sequence[int]
+
+    def __len__(self) -> int:
+        return len(self.rule)
+
+    def rule_name(self, index: int) -> str | None:
+        rule = int(self.rule[index])
+        return None if rule == UNASSIGNED else self.rule_names[rule]
+
+    def row(self, index: int, config: Config) -> MatchResult:
+        user_state = {
+            user: int(column[index])
+            for user, column in zip(self.users, self.user_states)
+        }
+        return MatchResult(
+            room=self.room_states[self.room[index]],
+            occupancy=self.occupancy_states[self.occupancy[index]],
+            user_state=decode_user_states(
+                user_state, config.users_groups, config.settings.state_encoding
+            ),
+            rule_name=self.rule_name(index),
+        )
+
+    def rows(self, config: Config) -> Iterator[MatchResult]:
+        for index in range(len(self)):
+            yield self.row(index, config)
+
+    def unassigned(self) -> Iterator[int]:
+        for index, rule in enumerate(self.rule):
+            if rule == UNASSIGNED:
+                yield index
+
+    @classmethod
+    def concat(cls, tables: List["TruthTable"]) -> "TruthTable":
+        """
+        Joins tables built for consecutive chunks of the same light group
+        """
+        first = tables[0]
+        return cls(
+            room_states=first.room_states,
+            occupancy_states=first.occupancy_states,
+            users=first.users,
+            rule_names=first.rule_names,
+            room=_concat_columns([t.room for t in tables]),
+            occupancy=_concat_columns([t.occupancy for t in tables]),
+            user_states=[
+                _concat_columns([t.user_states[i] for t in tables])
+                for i in range(len(first.users))
+            ],
+            rule=_concat_columns([t.rule for t in tables]),
+        )
+
+
+def _concat_columns(columns: List[Sequence[int]]) -> Sequence[int]:
+    if all(isinstance(column, list) for column in columns):
+        return list(itertools.chain.from_iterable(columns))
+
+    from . import exhaustive_numpy
+
+    return exhaustive_numpy.concat_columns(columns)
+
+
+def build_truth_table(
+    group: LightGroup,
+    config: Config,
+    use_numpy: bool | None = None,
+    start: int = 0,
+    stop: int | None = None,
+) -> TruthTable:
+    """
+    Builds the truth table for a light group using numpy when it's installed. Pass
+    use_numpy to force (True) or disable (False) the numpy backend. start/stop
+    limit the table to that range of user state combinations
+    """
+    if use_numpy is not False:
+        try:
+            from . import exhaustive_numpy
+        except ImportError:
+            if use_numpy:
+                raise
+        else:
+            return exhaustive_numpy.build_truth_table(group, config, start, stop)
+
+    room_states, occupancy_states = cell_states(config)
+    domains = RuleUserDomains.from_config(config)
+    evaluator = RuleEvaluator.for_light_group(group, room_states, occupancy_states)
+
+    users = [
+        name for names in domains.components(group.get_rule_users()) for name in names
+    ]
+    room: List[int] = []
+    occupancy: List[int] = []
+    user_states: List[List[int]] = [[] for _ in users]
+    rule: List[int] = []
+    combinations = domains.combinations_for_rule_users(
+        group.get_rule_users(), start, stop
+    )
+    for user_state in combinations:
+        matches = evaluator.first_matches(user_state)
+        for cell, matched in enumerate(matches):
+            room.append(cell // len(occupancy_states))
+            occupancy.append(cell % len(occupancy_states))
+            rule.append(matched)
+        for column, user in zip(user_states, users):
+            column.extend([user_state[user]] * len(matches))
+
+    return TruthTable(
+        room_states=room_states,
+        occupancy_states=occupancy_states,
+        users=users,
+        rule_names=[r.state_name for r in group.rules],
+        room=room,
+        occupancy=occupancy,
+        user_states=list(user_states),
+        rule=rule,
+    )
+
+
+# Don't bother splitting a light group into chunks smaller than this many user
+# state combinations, the overhead of shipping the chunk to a worker dominates
+MIN_CHUNK_COMBINATIONS = 256
+
+
+def _build_truth_table_chunk(
+    config: Config, name: str, use_numpy: bool | None, start: int, stop: int
+) -> TruthTable:
+    return build_truth_table(config.lights[name], config, use_numpy, start, stop)
+
+
+def build_truth_tables(
+    config: Config,
+    use_numpy: bool | None = None,
+    jobs: int = 1,
+    light_groups: List[str] | None = None,
+) -> Mapping[str, TruthTable]:
+    """
+    Builds the truth table for each light group (or only the named ones). With
+    jobs > 1 the light groups, and the user state combinations of any large
+    light group, are split into chunks and built in a process pool. The chunks
+    are joined back in order so the result is the same as building serially
+    """
+    if light_groups is None:
+        light_groups = list(config.lights)
+
+    if jobs <= 1:
+        return {
+            name: build_truth_table(config.lights[name], config, use_numpy=use_numpy)
+            for name in light_groups
+        }
+
+    domains = RuleUserDomains.from_config(config)
+    chunks: Dict[str, List[Tuple[int, int]]] = {}
+    for name in light_groups:
+        count = domains.combination_count(config.lights[name].get_rule_users())
+        size = max(MIN_CHUNK_COMBINATIONS, math.ceil(count / jobs))
+        chunks[name] = [
+            (start, min(start + size, count)) for start in range(0, count, size)
+        ] or [(0, 0)]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            name: [
+                executor.submit(
+                    _build_truth_table_chunk, config, name, use_numpy, start, stop
+                )
+                for start, stop in name_chunks
+            ]
+            for name, name_chunks in chunks.items()
+        }
+        return {
+            name: TruthTable.concat([future.result() for future in name_futures])
+            for name, name_futures in futures.items()
+        }
+
+
+DecisionKey = Tuple[str, str, Tuple[int, ...]]
+
+
+@dataclass
+class DecisionTable:
+    """
+    A precompiled version of the first-match rule scan for a single light group.
+    Every (room_state, occupancy, user states) combination that
+    gen_light_group_matches can produce maps straight to the winning rule name
+    """
+
+    # The rule users in the order their states appear in each key
+    users: List[str]
+
+    decisions: Dict[DecisionKey, str | None]
+
+    @classmethod
+    def make_key(
+        cls, room_state: str, occupancy: str, user_states: Sequence[int]
+    ) -> DecisionKey:
+        return (room_state, occupancy, tuple(user_states))
+
+    def lookup(
+        self, room_state: str, occupancy: str, user_states: Mapping[str, int]
+    ) -> str | None:
+        """
+        Returns the matching rule name (or None if no rule matches). Raises
+        KeyError if the state is not one that was compiled into the table
+        """
+        key = self.make_key(
+            room_state, occupancy, [user_states[user] for user in self.users]
+        )
+        return self.decisions[key]
+
+    @classmethod
+    def from_truth_table(cls, table: TruthTable) -> "DecisionTable":
+        decisions: Dict[DecisionKey, str | None] = {}
+        for index in range(len(table)):
+            key = cls.make_key(
+                table.room_states[table.room[index]],
+                table.occupancy_states[table.occupancy[index]],
+                [int(column[index]) for column in table.user_states],
+            )
+            decisions[key] = table.rule_name(index)
+        return cls(users=table.users, decisions=decisions)
+
+
+def build_decision_table(group: LightGroup, config: Config) -> DecisionTable:
+    return DecisionTable.from_truth_table(build_truth_table(group, config))
@@ -0,0 +1,126 @@
+"""
+A numpy version of building a TruthTable. This is optional and only used
+when numpy is installed, the pure python version in exhaustive is the
+reference implementation.
+"""
+
+import math
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .datatypes import Config, LightGroup
+from .datatypes.match import MatchUser, MatchUserSingle, MatchUserWildcard
+from .exhaustive import (
+    UNASSIGNED,
+    RuleEvaluator,
+    RuleUserDomains,
+    TruthTable,
+    cell_states,
+)
+
+
+def _user_combinations(
+    domains: RuleUserDomains,
+    components: List[List[str]],
+    start: int,
+    stop: int | None,
+) -> Dict[str, np.ndarray]:
+    """
+    One column per rule user with a row for every combination of user states in
+    [start, stop). Rows are in the same order as
+    RuleUserDomains.combinations_for_rule_users
+    """
+    component_domains = [
+        np.array(domains.component_domain(names), dtype=np.int64).reshape(
+            -1, len(names)
+        )
+        for names in components
+    ]
+    sizes = [len(domain) for domain in component_domains]
+    if not sizes:
+        return {}
+
+    # Row-major like itertools.product so the last component changes fastest
+    total = math.prod(sizes)
+    stop = total if stop is None else min(stop, total)
+    indexes = np.unravel_index(np.arange(start, max(start, stop)), sizes)
+    out = {}
+    for names, domain, index in zip(components, component_domains, indexes):
+        values = domain[index]
+        for i, name in enumerate(names):
+            out[name] = values[:, i]
+    return out
+
+
+def _match_users(
+    rule_users: List[MatchUser],
+    columns: Dict[str, np.ndarray],
+    rows: int,
+) -> np.ndarray:
+    out = np.ones(rows, dtype=bool)
+    for match_user in rule_users:
+        if isinstance(match_user, MatchUserWildcard):
+            continue
+        elif not isinstance(match_user, MatchUserSingle):
+            raise NotImplementedError(
+                f"Unknown type of user match '{type(match_user).__name__}'"
+            )
+
+        # Each column only has a handful of distinct masks so run the real
+        # matcher once per distinct mask and broadcast the result
+        values, inverse = np.unique(columns[match_user.user], return_inverse=True)
+        matched = np.array(
+            [match_user.match_multi.match(int(v)) for v in values], dtype=bool
+        )
+        out &= matched[inverse.reshape(-1)]
+    return out
+
+
+def concat_columns(columns: List[Sequence[int]]) -> np.ndarray:
+    return np.concatenate([np.asarray(column) for column in columns])
+
+
+def build_truth_table(
+    group: LightGroup, config: Config, start: int = 0, stop: int | None = None
+) -> TruthTable:
+    room_states, occupancy_states = cell_states(config)
+    domains = RuleUserDomains.from_config(config)
+    evaluator = RuleEvaluator.for_light_group(group, room_states, occupancy_states)
+
+    components = domains.components(group.get_rule_users())
+    users = [name for names in components for name in names]
+    columns = _user_combinations(domains, components, start, stop)
+    if columns:
+        combinations = len(next(iter(columns.values())))
+    else:
+        # With no rule users there is a single (empty) combination
+        combinations = len(range(start, 1 if stop is None else min(stop, 1)))
+    cells = len(evaluator.cells)
+
+    matches = np.zeros((len(group.rules), combinations, cells), dtype=bool)
+    for i, (rule, rule_cells) in enumerate(zip(group.rules, evaluator.rule_cells)):
+        cell_matches = np.array(
+            [(rule_cells >> cell) & 1 for cell in range(cells)], dtype=bool
+        )
+        user_matches = _match_users(rule.rule_match.user_state, columns, combinations)
+        matches[i] = user_matches[:, None] & cell_matches[None, :]
+
+    # argmax finds the first True so is the first matching rule in each cell
+    if len(group.rules):
+        rule = matches.argmax(axis=0)
+        rule[~matches.any(axis=0)] = UNASSIGNED
+    else:
+        rule = np.full((combinations, cells), UNASSIGNED)
+
+    cell_index = np.arange(cells)
+    return TruthTable(
+        room_states=room_states,
+        occupancy_states=occupancy_states,
+        users=users,
+        rule_names=[r.state_name for r in group.rules],
+        room=np.tile(cell_index // len(occupancy_states), combinations),
+        occupancy=np.tile(cell_index % len(occupancy_states), combinations),
+        user_states=[np.repeat(columns[user], cells) for user in users],
+        rule=rule.reshape(-1),
+    )
@@ -0,0 +1,300 @@
+"""
+The dependency graph between the calculated entities, which recalculates
+everything downstream of a change once, in topological order.
+"""
+import asyncio
+import heapq
+import logging
+from graphlib import CycleError, TopologicalSorter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Protocol,
+    Set,
+    Tuple,
+)
+
+from homeassistant.core import Event, HomeAssistant, callback
+
+from .datatypes import Config
+
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_GRAPH = "light_motion_profiles_graph"
+
+
+class GraphNode(Protocol):
+    entity_id: str
+
+    # Every entity whose state is used to calculate this one
+    _dependent_entities: List[str]
+
+    def _force_update(self, event: object) -> bool:
+        """
+        Recalculates and writes the state, returns True if it changed
+        """
+
+    def _input_changed(self, event: Event) -> None:
+        """
+        Called with every dispatched change to an input from outside the graph,
+        before the node is scheduled
+        """
+
+    def async_write_ha_state(self) -> None:
+        """
+        Writes the state to hass
+        """
+
+
+class DependencyGraph:
+    def __init__(
+        self,
+        calculated_entities: Iterable[str],
+        loop: asyncio.AbstractEventLoop | None = None,
+        debounce: float = 0.0,
+        fast_inputs: Iterable[str] = (),
+    ) -> None:
+        # Every entity that will be calculated by a node of the graph. This is
+        # known up front so nodes can tell which of their inputs come from the
+        # graph, no matter the order they're added in
+        self.calculated_entities: Set[str] = set(calculated_entities)
+
+        self._nodes: Dict[str, GraphNode] = {}
+        self._consumers: Dict[str, List[str]] = {}
+        # The nodes using each entity from outside the graph
+        self._inputs: Dict[str, List[str]] = {}
+        self._order: Dict[str, int] | None = None
+
+        # Nodes waiting to be recalculated by the current pass as
+        # (topological index, entity_id)
+        self._pending: List[Tuple[int, str]] = []
+        self._queued: Set[str] = set()
+        self._running = False
+
+        # Without a loop scheduled updates run straight away
+        self._loop = loop
+        self._debounce = debounce
+        self._flush_handle: asyncio.Handle | None = None
+
+        # Inputs whose changes are run through the graph from the listener
+        self._fast_inputs: Set[str] = set(fast_inputs)
+        self._fast_pass_hooks: List[Callable[[], None]] = []
+        # Nodes whose state is written once the running fast pass is done
+        self._deferring = False
+        self._unpublished: Dict[str, GraphNode] = {}
+
+    @classmethod
+    def from_config(
+        cls, config: Config, loop: asyncio.AbstractEventLoop | None = None
+    ) -> "DependencyGraph":
+        entities = []
+        for user in config.users_groups.users.values():
+            entities.append(user.home_away_entity.full)
+            entities.append(user.presence_entity.full)
+        for group in config.users_groups.groups.values():
+            entities.append(group.presence_entity.full)
+        fast_inputs = []
+        for light in config.lights.values():
+            if isinstance(light.occupancy_sensors, list):
+                entities.append(light.motion_sensor_group_entity.full)
+                fast_inputs.extend(e.entity for e in light.occupancy_sensors)
+            else:
+                fast_inputs.append(light.occupancy_sensors.entity)
+            entities.append(light.room_occupancy_entity.full)
+            entities.append(light.light_rule_entity.full)
+            entities.append(light.light_automation_entity.full)
+        return cls(
+            entities,
+            loop,
+            config.settings.update_debounce,
+            fast_inputs if config.settings.motion_fast_path else (),
+        )
+
+    def is_calculated(self, entity_id: str) -> bool:
+        return entity_id in self.calculated_entities
+
+    def add(self, node: GraphNode) -> None:
+        self._nodes[node.entity_id] = node
+        for dependency in node._dependent_entities:
+            if self.is_calculated(dependency):
+                self._consumers.setdefault(dependency, []).append(node.entity_id)
+            else:
+                self._inputs.setdefault(dependency, []).append(node.entity_id)
+        self._order = None
+
+    def remove(self, node: GraphNode) -> None:
+        self._nodes.pop(node.entity_id, None)
+        for dependency in node._dependent_entities:
+            for index in (self._consumers, self._inputs):
+                consumers = index.get(dependency, [])
+                if node.entity_id in consumers:
+                    consumers.remove(node.entity_id)
+        self._order = None
+
+    def _topological_order(self) -> Dict[str, int]:
+        if self._order is None:
+            sorter: TopologicalSorter = TopologicalSorter()
+            for entity_id, node in self._nodes.items():
+                dependencies = [d for d in node._dependent_entities if d in self._nodes]
+                sorter.add(entity_id, *dependencies)
+            try:
+                order = list(sorter.static_order())
+            except CycleError as e:
+                raise ValueError(f"Found a cycle between calculated entities: {e}")
+            self._order = {entity_id: i for i, entity_id in enumerate(order)}
+        return self._order
+
+    def _queue(self, entity_ids: Iterable[str]) -> None:
+        order = self._topological_order()
+        for entity_id in entity_ids:
+            if entity_id in self._nodes and entity_id not in self._queued:
+                self._queued.add(entity_id)
+                heapq.heappush(self._pending, (order[entity_id], entity_id))
+
+    def _run(self) -> None:
+        # Changes made while a pass is running (eg by a state write) join it
+        if self._running:
+            return
+
+        self._running = True
+        try:
+            while self._pending:
+                _, entity_id = heapq.heappop(self._pending)
+                self._queued.discard(entity_id)
+                node = self._nodes.get(entity_id)
+                if node is not None and node._force_update(None):
+                    self._queue(self._consumers.get(entity_id, []))
+        finally:
+            self._running = False
+
+    def update(self, node: GraphNode) -> None:
+        """
+        Recalculates node, and everything downstream of it that changes
+        """
+        self._queue([node.entity_id])
+        self._run()
+
+    def schedule(self, node: GraphNode) -> None:
+        """
+        Marks node dirty, it's recalculated along with everything else marked
+        before the pending pass runs
+        """
+        self._schedule([node.entity_id])
+
+    def _schedule(self, entity_ids: Iterable[str]) -> None:
+        self._queue(entity_ids)
+        if self._loop is None:
+            self._run()
+        elif self._flush_handle is None:
+            # The window starts at the first change so a steady stream of changes
+            # can't hold back updates forever
+            if self._debounce > 0:
+                self._flush_handle = self._loop.call_later(self._debounce, self._flush)
+            else:
+                self._flush_handle = self._loop.call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        self._run()
+
+    def add_fast_pass_hook(self, hook: Callable[[], None]) -> None:
+        """
+        hook is called after every fast pass, before its state writes
+        """
+        self._fast_pass_hooks.append(hook)
+
+    def _run_fast(self, entity_ids: Iterable[str]) -> None:
+        self._queue(entity_ids)
+        if self._running:
+            return
+
+        self._deferring = True
+        try:
+            self._run()
+        finally:
+            self._deferring = False
+        for hook in self._fast_pass_hooks:
+            hook()
+
+        if self._loop is None:
+            self._publish()
+        elif self._unpublished:
+            # After the tasks the hooks created, eg the light service calls
+            self._loop.call_soon(self._publish)
+
+    def publish(self, node: GraphNode) -> None:
+        """
+        Writes the state of node to hass, once the pass is done if it's a fast one
+        """
+        if self._deferring:
+            self._unpublished[node.entity_id] = node
+        else:
+            node.async_write_ha_state()
+
+    def _publish(self) -> None:
+        unpublished, self._unpublished = self._unpublished, {}
+        for entity_id, node in unpublished.items():
+            # Unless it was removed in the meantime
+            if entity_id in self._nodes:
+                node.async_write_ha_state()
+
+    @callback
+    def async_is_input(self, event: Event | Mapping[str, Any]) -> bool:
+        """
+        The event_filter of the state_changed listener, so hass only calls it for
+        changes to an input of a node rather than every state in the instance
+        """
+        # Newer versions of hass pass the filter the event data
+        data = event if isinstance(event, Mapping) else event.data
+        return bool(self._inputs.get(data["entity_id"]))
+
+    @callback
+    def async_state_changed(self, event: Event) -> None:
+        consumers = self._inputs.get(event.data["entity_id"])
+        if not consumers:
+            return
+
+        # Nodes only ever read the state of their inputs, never the attributes
+        old_state = event.data["old_state"]
+        new_state = event.data["new_state"]
+        if (
+            old_state is not None
+            and new_state is not None
+            and old_state.state == new_state.state
+        ):
+            return
+
+        for entity_id in consumers:
+            self._nodes[entity_id]._input_changed(event)
+        if event.data["entity_id"] in self._fast_inputs:
+            self._run_fast(consumers)
+        else:
+            self._schedule(consumers)
+
+    def changed(self, *nodes: GraphNode) -> None:
+        """
+        Recalculates everything downstream of nodes after they changed themselves.
+        Nodes waiting for the pending pass keep waiting for it
+        """
+        if self._running:
+            for node in nodes:
+                self._queue(self._consumers.get(node.entity_id, []))
+            return
+
+        pending, queued = self._pending, self._queued
+        self._pending, self._queued = [], set()
+        try:
+            for node in nodes:
+                self._queue(self._consumers.get(node.entity_id, []))
+            self._run()
+        finally:
+            self._pending, self._queued = pending, queued
+
+
+def get_graph(hass: HomeAssistant) -> DependencyGraph:
+    return hass.data[DATA_GRAPH]
@@ -0,0 +1,163 @@
+"""
+Re-issues the commands of lights that aren't in the state they were sent.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Mapping, Protocol, Set, Tuple
+
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import HomeAssistant
+
+from .actuator import LightActuator
+
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_RECONCILER = "light_motion_profiles_reconciler"
+
+
+class ReconciledLight(Protocol):
+    light_entity: str
+
+    def reconcile_command(self) -> Tuple[str, Dict[str, Any]] | None:
+        """
+        The command the light should have last been sent, None if it isn't
+        being managed right now (eg under a killswitch)
+        """
+
+
+class LightReconciler:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        actuator: LightActuator,
+        interval: float,
+        batch_size: int,
+    ) -> None:
+        self._hass = hass
+        self._actuator = actuator
+        self._interval = interval
+        self._batch_size = batch_size
+
+        self._lights: List[ReconciledLight] = []
+        # Where the next batch starts
+        self._cursor = 0
+        # Lights a command was re-issued to that haven't been seen to match yet
+        self._reissued: Set[str] = set()
+
+        self.checked = 0
+        self.divergent = 0
+        self.corrected = 0
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self._interval > 0
+
+    def add(self, light: ReconciledLight) -> None:
+        self._lights.append(light)
+
+    def remove(self, light: ReconciledLight) -> None:
+        if light in self._lights:
+            index = self._lights.index(light)
+            del self._lights[index]
+            if index < self._cursor:
+                self._cursor -= 1
+        self._reissued.discard(light.light_entity)
+
+    def start(self) -> Callable[[], None]:
+        """
+        Starts checking a batch every interval, returns the function that stops
+        it again
+        """
+        if not self.enabled:
+            return lambda: None
+
+        handle: asyncio.TimerHandle | None = None
+
+        def tick() -> None:
+            nonlocal handle
+            handle = self._hass.loop.call_later(self._interval, tick)
+            self.tick()
+
+        def stop() -> None:
+            if handle is not None:
+                handle.cancel()
+
+        handle = self._hass.loop.call_later(self._interval, tick)
+        return stop
+
+    def _batch(self) -> List[ReconciledLight]:
+        if self._cursor >= len(self._lights):
+            self._cursor = 0
+        batch = self._lights[self._cursor : self._cursor + self._batch_size]
+        self._cursor += len(batch)
+        return batch
+
+    def tick(self) -> None:
+        """
+        Checks the next batch of lights, re-issuing the commands of the ones
+        that aren't in the state they were sent
+        """
+        before = self._counts()
+        for light in self._batch():
+            self._check(light)
+        # Checks that found everything as it should be aren't worth a state write
+        if self._counts() != before:
+            self.notify()
+
+    def _counts(self) -> Tuple[int, int, int]:
+        return self.divergent, self.corrected, len(self._reissued)
+
+    def _check(self, light: ReconciledLight) -> None:
+        entity_id = light.light_entity
+        state = self._hass.states.get(entity_id)
+        # Nothing can be done for a light that isn't there, and one with a
+        # command still waiting to be sent will be changed anyway
+        if (
+            state is None
+            or state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN)
+            or self._actuator.is_queued(entity_id)
+        ):
+            return
+
+        command = light.reconcile_command()
+        if command is None:
+            self._reissued.discard(entity_id)
+            return
+
+        self.checked += 1
+        service, data = command
+        if self._actuator.matches(service, entity_id, data):
+            if entity_id in self._reissued:
+                self._reissued.discard(entity_id)
+                self.corrected += 1
+            return
+
+        # Lights still transitioning to the state they were sent aren't sent it
+        # again by the actuator
+        if self._actuator.call(service, entity_id, data):
+            _LOGGER.info(f"re-sending {service} {data} to {entity_id}, it diverged")
+            self.divergent += 1
+            self._reissued.add(entity_id)
+
+    def metrics(self) -> Mapping[str, Any]:
+        return {
+            "lights": len(self._lights),
+            "checked": self.checked,
+            "divergent": self.divergent,
+            "corrected": self.corrected,
+            "uncorrected": len(self._reissued),
+        }
+
+    def add_listener(self, listener: Callable[[], None]) -> Callable[[], None]:
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def notify(self) -> None:
+        for listener in self._listeners:
+            listener()
+
+
+def get_reconciler(hass: HomeAssistant) -> LightReconciler:
+    return hass.data[DATA_RECONCILER]
@@ -1,31 +1,33 @@
 import logging
-import asyncio
-from datetime import timedelta, datetime
-from typing import Mapping, List, Set, Any, TypeVar, Generic, Dict, Callable
+from typing import Mapping, List, Any, TypeVar, Generic, Dict, Sequence, Tuple
 
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS_PCT,
     ATTR_TRANSITION,
     DOMAIN as LIGHT_DOMAIN,
 )
-from homeassistant.util import dt as dt_util
 from homeassistant.const import (
     STATE_ON,
     STATE_OFF,
     SERVICE_TURN_ON,
     SERVICE_TURN_OFF,
-    ATTR_ENTITY_ID,
 )
-from homeassistant.helpers.event import (
-    async_track_point_in_utc_time,
-    async_track_state_change_event,
-)
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.core import HomeAssistant
 from homeassistant.components.sensor import SensorEntity, DOMAIN as SENSOR_DOMAIN
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from . import GROUP_SEPARATOR
+from .actuator import LightActuator, MeshQueue, get_actuator
+from .exhaustive import DecisionTable
+from .graph import get_graph
+from .reconciler import LightReconciler, get_reconciler
+from .store import get_store
+from .timeouts import get_timeouts
+from .truth_table_cache import (
+    TruthTableCache,
+    build_decision_table_cached,
+    light_group_key,
+)
 from .datatypes import (
     Config,
     User,
@@ -35,11 +37,16 @@ from .datatypes import (
     LightGroup,
     RoomSettings,
     Entity,
+    StateEncoding,
 )
+from .datatypes.entity import Domain
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# Owned by the integration, .storage is managed by hass for its own stores
+CACHE_DIR = "light_motion_profiles"
+
 
 async def async_setup_platform(
     hass: HomeAssistant,
@@ -47,7 +54,7 @@ async def async_setup_platform(
     async_add_entities: AddEntitiesCallback,
     config: Config,
 ) -> None:
-    user_sensors: List[SensorEntity] = []
+    user_sensors: List[CalculatedSensor] = []
     for user in config.users_groups.users.values():
         user_sensors.append(
             UserHomeAwaySensor(
@@ -55,18 +62,27 @@ async def async_setup_platform(
                 config.settings.users_groups,
             )
         )
-        user_sensors.append(UserPresenceSensor(user, config.settings.users_groups))
+        user_sensors.append(
+            UserPresenceSensor(
+                user,
+                config.settings.users_groups,
+                config.settings.state_encoding,
+            )
+        )
 
-    async_add_entities(user_sensors)
+    await async_add_calculated(hass, async_add_entities, user_sensors)
 
-    group_sensors = []
+    group_sensors: List[CalculatedSensor] = []
     for group in config.users_groups.groups.values():
         group_sensors.append(
             GroupPresenceSensor(
-                group, config.users_groups, config.settings.users_groups
+                group,
+                config.users_groups,
+                config.settings.users_groups,
+                config.settings.state_encoding,
             )
         )
-    async_add_entities(group_sensors)
+    await async_add_calculated(hass, async_add_entities, group_sensors)
 
     # profile_icons = {}
     # for name, profile in discovery_info[FIELD_LIGHT_PROFILES].items():
@@ -75,7 +91,11 @@ async def async_setup_platform(
 
     # _LOGGER.warning(f"profile_icons={profile_icons}")
 
-    light_sensors: List[SensorEntity] = []
+    # Truth tables only change when a light group's rules or users do, so keep
+    # them between restarts
+    cache = TruthTableCache(hass.config.path(CACHE_DIR, "truth_tables"))
+
+    light_sensors: List[CalculatedSensor] = []
     for light_config in config.lights.values():
         light_sensors.append(
             RoomOccupancyEntity(
@@ -83,10 +103,19 @@ async def async_setup_platform(
                 config.settings.room,
             )
         )
+        decision_table = await hass.async_add_executor_job(
+            build_decision_table_cached,
+            light_config,
+            config,
+            cache,
+            light_group_key(light_config, config),
+        )
         light_sensors.append(
             LightRuleEntity(
                 light_config,
                 config.users_groups,
+                config.settings.state_encoding,
+                decision_table,
             )
         )
         light_sensors.append(
@@ -96,7 +125,43 @@ async def async_setup_platform(
             )
         )
 
-    async_add_entities(light_sensors)
+    await async_add_calculated(hass, async_add_entities, light_sensors)
+
+    async_add_entities(
+        diagnostic_sensors(config, get_actuator(hass), get_reconciler(hass))
+    )
+
+
+def diagnostic_sensors(
+    config: Config, actuator: LightActuator, reconciler: LightReconciler
+) -> List[SensorEntity]:
+    sensors: List[SensorEntity] = [
+        MeshQueueSensor(config.mesh_queue_entity(name), mesh)
+        for name, mesh in actuator.meshes.items()
+    ]
+    # An idle reconciler has nothing to report
+    if reconciler.enabled:
+        sensors.append(ReconcilerSensor(config.reconciler_entity, reconciler))
+    return sensors
+
+
+async def async_add_calculated(
+    hass: HomeAssistant,
+    async_add_entities: AddEntitiesCallback,
+    entities: Sequence["CalculatedSensor"],
+) -> None:
+    """
+    Adds entities to hass, apart from the internal ones which are only added to
+    the graph
+    """
+    published = []
+    for entity in entities:
+        if entity.internal:
+            entity.hass = hass
+            await entity.async_added_to_hass()
+        else:
+            published.append(entity)
+    async_add_entities(published)
 
 
 T = TypeVar("T")
@@ -109,44 +174,86 @@ class CalculatedSensor(Generic[T]):
         super().__init__()
         setattr(self, self.PRIMARY_ATTR, None)
         self._icons: Mapping[T, str] | None = None
+        self.internal = False
+
+    def _set_entity(self, entity: Entity, domain: str) -> None:
+        # Internal entities are only nodes of the graph and never added to hass,
+        # so their id is set here rather than by the platform
+        self.internal = entity.domain == Domain.INTERNAL
+        assert self.internal or entity.domain.value == domain
+        self._attr_name = entity.name
+        if self.internal:
+            self.entity_id = entity.full
 
     def _apply_state(self, new_state: T) -> bool:
+        """
+        Returns True if the primary value changed
+        """
+        if getattr(self, self.PRIMARY_ATTR) == new_state:
+            return False
         setattr(self, self.PRIMARY_ATTR, new_state)
         return True
 
-    def _apply_icon(self, new_state: T) -> None:
-        if self._icons is not None:
-            self._attr_icon = self._icons.get(new_state)
+    def _apply_icon(self, new_state: T) -> bool:
+        if self._icons is None:
+            return False
+        icon = self._icons.get(new_state)
+        if getattr(self, "_attr_icon", None) == icon:
+            return False
+        self._attr_icon = icon
+        return True
 
     def _apply_and_save_state(self, new_state: T) -> bool:
+        """
+        Only writes to hass when the value or icon changed, returns True if it did
+        """
         changed = self._apply_state(new_state)
-        if changed:
-            self._apply_icon(new_state)
-            self.async_write_ha_state()
+        changed = self._apply_icon(new_state) or changed
+        if changed and not self.internal:
+            get_graph(self.hass).publish(self)
         return changed
 
-    def _force_update(self, event: Any) -> None:
-        new_state = self.calculate_current_state()
+    def _apply_and_save_value(self, value: Any) -> bool:
+        """
+        Keeps the typed value for the entities that read it and publishes the
+        state to hass
+        """
+        get_store(self.hass).set(self.entity_id, value)
+        new_state = self._serialize(value)
         _LOGGER.info(f"new_state for {self._attr_name}={new_state}")
-        self._apply_and_save_state(new_state)
+        return self._apply_and_save_state(new_state)
+
+    def _force_update(self, event: Any) -> bool:
+        return self._apply_and_save_value(self.calculate_current_value())
+
+    def _input_changed(self, event: Any) -> None:
+        pass
 
     def calculate_current_state(self) -> T:
         raise NotImplementedError("Abstract")
 
+    def calculate_current_value(self) -> Any:
+        """
+        The typed value of the entity, by default the same as its state
+        """
+        return self.calculate_current_state()
+
+    def _serialize(self, value: Any) -> T:
+        return value
+
     async def async_added_to_hass(self) -> None:
-        @callback
-        def dependent_entity_change(event: Any) -> None:
-            self._force_update(event)
+        graph = get_graph(self.hass)
+        store = get_store(self.hass)
 
-        _LOGGER.debug(
-            f"subscribing {self._attr_name} up for {self._dependent_entities} updates"
-        )
-        self.async_on_remove(
-            async_track_state_change_event(
-                self.hass, self._dependent_entities, dependent_entity_change
-            )
-        )
-        self._force_update(None)
+        # The graph's listener dispatches changes to our inputs, so we don't
+        # subscribe to them ourselves
+        _LOGGER.debug(f"adding {self._attr_name} to the graph")
+        graph.add(self)
+        if self.internal:
+            store.add_internal(self.entity_id)
+        self.async_on_remove(lambda: graph.remove(self))
+        self.async_on_remove(lambda: store.remove(self.entity_id))
+        graph.schedule(self)
 
 
 class UserHomeAwaySensor(CalculatedSensor[str], SensorEntity):
@@ -158,9 +265,7 @@ class UserHomeAwaySensor(CalculatedSensor[str], SensorEntity):
         super().__init__()
 
         entity = user.home_away_entity
-        assert entity.domain.value == SENSOR_DOMAIN
-
-        self._attr_name = entity.name
+        self._set_entity(entity, SENSOR_DOMAIN)
         self._icons = user.home_away_icons
         self._tracking_entity = (
             user.tracking_entity.entity if user.tracking_entity else None
@@ -188,12 +293,12 @@ class UserHomeAwaySensor(CalculatedSensor[str], SensorEntity):
 
 
 class UserPresenceSensor(CalculatedSensor[str], SensorEntity):
-    def __init__(self, user: User, settings: UserGroupSettings) -> None:
+    def __init__(
+        self, user: User, settings: UserGroupSettings, encoding: StateEncoding
+    ) -> None:
         super().__init__()
         entity = user.presence_entity
-        assert entity.domain.value == SENSOR_DOMAIN
-
-        self._attr_name = entity.name
+        self._set_entity(entity, SENSOR_DOMAIN)
         self._icons = user.state_icons
 
         self._home_away_entity = user.home_away_entity.full
@@ -206,68 +311,76 @@ class UserPresenceSensor(CalculatedSensor[str], SensorEntity):
             self._exists_entity = user.exists_entity.full
             self._dependent_entities.append(self._exists_entity)
 
-        self._state_absent = settings.absent_state
+        self._encoding = encoding
+        self._state_absent = encoding.bit(settings.absent_state)
+        self._state_if_unknown = encoding.bit(settings.state_if_unknown)
         self._state_unknown = settings.home_away_states.unknown
         self._state_not_home = settings.home_away_states.not_home
 
-    def calculate_current_state(self) -> str:
+    def calculate_current_value(self) -> int:
         if self._exists_entity:
             exists = self.hass.states.get(self._exists_entity)
             if exists is None or exists.state == "off":
                 return self._state_absent
 
-        home_away = self.hass.states.get(self._home_away_entity)
+        home_away = get_store(self.hass).get(self._home_away_entity, str)
         if home_away is not None:
-            if home_away.state == self._state_not_home:
+            if home_away == self._state_not_home:
                 return self._state_absent
-            if home_away.state.lower() == self._state_unknown:
+            if home_away.lower() == self._state_unknown:
                 return self._state_if_unknown
 
         user_state = self.hass.states.get(self._state_entity)
         if user_state is not None:
-            return user_state.state
+            return self._encoding.bit(user_state.state)
         else:
             return self._state_if_unknown
 
+    def _serialize(self, value: int) -> str:
+        return self._encoding.decode_single(value)
+
 
 class GroupPresenceSensor(CalculatedSensor[str], SensorEntity):
     def __init__(
-        self, group: Group, users_groups: UsersGroups, settings: UserGroupSettings
+        self,
+        group: Group,
+        users_groups: UsersGroups,
+        settings: UserGroupSettings,
+        encoding: StateEncoding,
     ) -> None:
         super().__init__()
         entity = group.presence_entity
-        assert entity.domain.value == SENSOR_DOMAIN
-        self._attr_name = entity.name
+        self._set_entity(entity, SENSOR_DOMAIN)
 
+        # Nested groups are flattened down to their users so a user change
+        # updates every group containing it in one step rather than one layer of
+        # groups at a time. Combining the users directly gives the same result
+        # as combining the nested groups
         self._member_entities = {}
-        for member in group.members:
-            self._member_entities[member] = users_groups.presence_entity(member).full
+        for member, user in users_groups.members(group.name).items():
+            self._member_entities[member] = user.presence_entity.full
 
         self._dependent_entities = list(self._member_entities.values())
-        self._state_absent = settings.absent_state
-        self._state_if_unknown = settings.state_if_unknown
-
-    @classmethod
-    def deserialize(cls, value: str) -> Set[str]:
-        return set(value.split(GROUP_SEPARATOR))
-
-    @classmethod
-    def serialize(cls, states: Set[str]) -> str:
-        return GROUP_SEPARATOR.join(sorted(set(states)))
+        self._encoding = encoding
+        self._state_absent = encoding.bit(settings.absent_state)
+        self._state_if_unknown = encoding.bit(settings.state_if_unknown)
 
-    def calculate_current_state(self) -> str:
-        member_states: Dict[str, str | Set[str]] = {}
+    def calculate_current_value(self) -> int:
+        store = get_store(self.hass)
+        member_states: Dict[str, int] = {}
         for member, member_entity in self._member_entities.items():
-            member_state = self.hass.states.get(member_entity)
+            member_state = store.get(member_entity, self._encoding.deserialize)
             if member_state is None:
                 member_states[member] = self._state_if_unknown
             else:
-                member_states[member] = self.deserialize(member_state.state)
+                member_states[member] = member_state
 
-        states = Group.resolve_group_states(
+        return Group.resolve_group_states(
             iter(member_states.values()), self._state_absent
         )
-        return self.serialize(states)
+
+    def _serialize(self, value: int) -> str:
+        return self._encoding.serialize(value)
 
 
 class RoomOccupancyEntity(CalculatedSensor[str], SensorEntity):
@@ -275,13 +388,10 @@ class RoomOccupancyEntity(CalculatedSensor[str], SensorEntity):
         super().__init__()
 
         entity = config.room_occupancy_entity
-        assert entity.domain.value == SENSOR_DOMAIN
-
-        self._attr_name = entity.name
-        self._no_motion_cb_cancel: Callable[[], None] | None = None
+        self._set_entity(entity, SENSOR_DOMAIN)
 
         self._motion_entity = config.motion_sensor_entity.entity
-        self._no_motion_timeout = timedelta(seconds=config.occupancy_timeout.value)
+        self._no_motion_timeout = config.occupancy_timeout.value
 
         self._dependent_entities = [
             self._motion_entity,
@@ -292,57 +402,51 @@ class RoomOccupancyEntity(CalculatedSensor[str], SensorEntity):
         self._state_empty = settings.occupancy_states.empty
 
     async def async_added_to_hass(self) -> None:
-        def on_remove() -> None:
-            if self._no_motion_cb_cancel is not None:
-                self._no_motion_cb_cancel()
-                self._no_motion_cb_cancel = None
-
-        self.async_on_remove(on_remove)
+        timeouts = get_timeouts(self.hass)
+        self.async_on_remove(lambda: timeouts.cancel(self))
         return await super().async_added_to_hass()
 
-    def _no_motion_callback(self, dt: datetime) -> None:
+    def _timed_out(self) -> bool:
         _LOGGER.warning(f"No motion callback {self._attr_name}")
-        self._apply_and_save_state(self._state_empty)
+        return self._apply_and_save_value(self._state_empty)
 
-    def _force_update(self, event: Any) -> None:
-        motion_state = self.hass.states.get(self._motion_entity)
+    def _force_update(self, event: Any) -> bool:
+        timeouts = get_timeouts(self.hass)
+        motion_state = get_store(self.hass).get(self._motion_entity, str)
         if motion_state is None:
-            return
-        motion_state = motion_state.state
+            return False
 
         new_state = None
         if motion_state == STATE_ON:
-            # If we detect motion we cancel the callback if it exists
-            if self._no_motion_cb_cancel is not None:
-                self._no_motion_cb_cancel()
-                self._no_motion_cb_cancel = None
+            # If we detect motion we cancel the timeout if it exists
+            timeouts.cancel(self)
             new_state = self._state_occupied
         elif motion_state == STATE_OFF:
-            # If we we don't see motion but already have a callback we do nothing
-            if self._no_motion_cb_cancel:
-                return
-
-            # Otherwise we schedule the callback
-            self._no_motion_cb_cancel = async_track_point_in_utc_time(
-                self.hass,
-                self._no_motion_callback,
-                dt_util.utcnow() + self._no_motion_timeout,
-            )
+            # If we we don't see motion but already have a timeout we do nothing
+            if timeouts.is_scheduled(self):
+                return False
+
+            # Otherwise we schedule the timeout
+            timeouts.schedule(self, self._no_motion_timeout)
             new_state = self._state_occupied_timeout
         else:
             _LOGGER.warning(f"Unknown state for motion entity {motion_state}")
-            return
+            return False
 
-        _LOGGER.info(f"new_state for {self._attr_name}={new_state}")
-        self._apply_and_save_state(new_state)
+        return self._apply_and_save_value(new_state)
 
 
 class LightRuleEntity(CalculatedSensor[str | None], SensorEntity):
-    def __init__(self, config: LightGroup, users_groups: UsersGroups) -> None:
+    def __init__(
+        self,
+        config: LightGroup,
+        users_groups: UsersGroups,
+        encoding: StateEncoding,
+        decision_table: DecisionTable,
+    ) -> None:
         super().__init__()
         entity = config.light_rule_entity
-        assert entity.domain.value == SENSOR_DOMAIN
-        self._attr_name = entity.name
+        self._set_entity(entity, SENSOR_DOMAIN)
 
         self._icons = {
             r.state_name: r.state.icon.value
@@ -351,6 +455,8 @@ class LightRuleEntity(CalculatedSensor[str | None], SensorEntity):
         }
 
         self._rules = config.rules
+        self._encoding = encoding
+        self._decision_table = decision_table
         self._user_group_entities = {
             member: users_groups.presence_entity(member).full
             for member in config.get_rule_users()
@@ -363,31 +469,40 @@ class LightRuleEntity(CalculatedSensor[str | None], SensorEntity):
     def calculate_current_state(self) -> str | None:
         # TODO make this auto when it's a thing
         room_state = "auto"
-        occupancy = self.hass.states.get(self._occupancy_entity)
+        store = get_store(self.hass)
+        occupancy = store.get(self._occupancy_entity, str)
         if occupancy is None:
             return None
-        else:
-            occupancy = occupancy.state
         user_states = {
-            member: self.hass.states.get(e)
+            member: store.get(e, self._encoding.deserialize)
             for member, e in self._user_group_entities.items()
         }
+        matched: str | None
         if any(v is None for v in user_states.values()):
-            pass
+            matched = self._scan_rules(room_state, occupancy, user_states)
         else:
-            user_states = {
-                m: GroupPresenceSensor.deserialize(e.state)
-                for m, e in user_states.items()
-            }
+            try:
+                matched = self._decision_table.lookup(
+                    room_state, occupancy, user_states
+                )
+            except KeyError:
+                # States outside of the known set (eg an unexpected person state) are
+                # not in the table so fall back to checking every rule
+                matched = self._scan_rules(room_state, occupancy, user_states)
+
+        if matched is None:
+            _LOGGER.warning(
+                f"No rules matched for {self._attr_name}: "
+                f"occupancy={occupancy} user_state={user_states}"
+            )
+        return matched
 
+    def _scan_rules(
+        self, room_state: str, occupancy: str, user_states: Mapping[str, Any]
+    ) -> str | None:
         for rule in self._rules:
             if rule.rule_match.match(room_state, occupancy, user_states):
                 return rule.state_name
-
-        _LOGGER.warning(
-            f"No rules matched for {self._attr_name}: "
-            f"occupancy={occupancy} user_state={user_states}"
-        )
         return None
 
 
@@ -395,8 +510,7 @@ class LightAutomationEntity(CalculatedSensor[str | None], SensorEntity):
     def __init__(self, light_config: LightGroup, global_ks: Entity) -> None:
         super().__init__()
         entity = light_config.light_automation_entity
-        assert entity.domain.value == SENSOR_DOMAIN
-        self._attr_name = entity.name
+        self._set_entity(entity, SENSOR_DOMAIN)
 
         self._global_killswitch_entity = global_ks.full
         self._killswitch_entity = light_config.killswitch_entity.full
@@ -408,7 +522,9 @@ class LightAutomationEntity(CalculatedSensor[str | None], SensorEntity):
             self._light_rule_entity,
         ]
 
-        self._light_entity = light_config.lights.entity
+        self.light_entity = light_config.lights.entity
+        # The rule the light was last set from
+        self._light_rule: str | None = None
         self._states = {r.state_name: r.state for r in light_config.rules}
         self._icons = {
             r.state_name: r.state.icon.value
@@ -417,33 +533,93 @@ class LightAutomationEntity(CalculatedSensor[str | None], SensorEntity):
         }
 
     def calculate_current_state(self) -> str | None:
-        rule_state = self.hass.states.get(self._light_rule_entity)
         # TODO: Deal with this better
-        if rule_state is None:
+        return get_store(self.hass).get(self._light_rule_entity, str)
+
+    def _apply_icon(self, light_rule: str | None) -> bool:
+        if light_rule is None or light_rule == "unknown":
+            return False
+        return super()._apply_icon(light_rule)
+
+    def _killswitches(self) -> Tuple[bool, bool]:
+        """
+        Whether the global and the local killswitch are on
+        """
+        global_killswitch = self.hass.states.get(self._global_killswitch_entity)
+        killswitch = self.hass.states.get(self._killswitch_entity)
+        return (
+            global_killswitch is not None and global_killswitch.state == STATE_ON,
+            killswitch is not None and killswitch.state == STATE_ON,
+        )
+
+    def light_command(self, light_rule: str) -> Tuple[str, Dict[str, Any]] | None:
+        """
+        The service and data that put the light in the profile of light_rule,
+        None if the light should be left as it is
+        """
+        target = self._states[light_rule]
+        light_state = self.hass.states.get(self.light_entity)
+        if light_state is None:
+            # _LOGGER.warning(
+            #     f"Requested to update light {self.light_entity} for automation "
+            #     f"{self._attr_name} but that light appears to not exists"
+            # )
             return None
 
-        return rule_state.state
+        service = None
+        if target.enable is None:
+            if light_state.state == STATE_ON:
+                service = SERVICE_TURN_ON
+        elif target.enable.value is True:
+            service = SERVICE_TURN_ON
+        elif target.enable.value is False:
+            service = SERVICE_TURN_OFF
+        else:
+            _LOGGER.warning(
+                "Got unexpected value for target.enable " f"'{target.enable}'"
+            )
+
+        service_data: Dict[str, Any] = {}
+        if service is None:
+            return None
+        elif service == SERVICE_TURN_ON:
+            if target.brightness:
+                service_data[ATTR_BRIGHTNESS_PCT] = target.brightness.value
+
+        if target.transition is not None:
+            service_data[ATTR_TRANSITION] = target.transition.value
+
+        return service, service_data
+
+    def reconcile_command(self) -> Tuple[str, Dict[str, Any]] | None:
+        """
+        The command the light should have last been sent, None if the light
+        isn't being managed right now
+        """
+        if self._light_rule is None or any(self._killswitches()):
+            return None
+        return self.light_command(self._light_rule)
 
     def _apply_state(self, light_rule: str | None) -> bool:
         if light_rule is None or light_rule == "unknown":
             return False
+        self._light_rule = light_rule
         target = self._states[light_rule]
 
         base_display_name = (
             target.source_profile if target.source_profile else light_rule
         )
         display_name = base_display_name
-        global_killswitch = self.hass.states.get(self._global_killswitch_entity)
+        global_killswitch, killswitch = self._killswitches()
         change_light = True
-        if global_killswitch is not None and global_killswitch.state == STATE_ON:
+        if global_killswitch:
             _LOGGER.info(
                 "refusing to update {self._attr_name} because of global killswitch"
             )
             change_light = False
             display_name = f"{base_display_name}(global_ks)"
 
-        killswitch = self.hass.states.get(self._killswitch_entity)
-        if killswitch is not None and killswitch.state == STATE_ON:
+        if killswitch:
             _LOGGER.info(
                 "refusing to update {self._attr_name} because of local killswitch"
             )
@@ -451,53 +627,73 @@ class LightAutomationEntity(CalculatedSensor[str | None], SensorEntity):
             display_name = f"{base_display_name}(local_ks)"
 
         # This sets the user facing attribute but doesn't change the light
-        super()._apply_state(display_name)
+        changed = super()._apply_state(display_name)
 
-        light_state = self.hass.states.get(self._light_entity)
-        if light_state is None:
-            pass
-            # _LOGGER.warning(
-            #     f"Requested to update light {self._light_entity} for automation "
-            #     f"{self._attr_name} but that light appears to not exists"
-            # )
-        elif change_light:
-            service = None
-            if target.enable is None:
-                if light_state.state == STATE_ON:
-                    service = SERVICE_TURN_ON
-            elif target.enable.value is True:
-                service = SERVICE_TURN_ON
-            elif target.enable.value is False:
-                service = SERVICE_TURN_OFF
-            else:
-                _LOGGER.warning(
-                    "Got unexpected value for target.enable " f"'{target.enable}'"
-                )
+        command = self.light_command(light_rule) if change_light else None
+        if command is not None:
+            service, service_data = command
+            _LOGGER.warning(
+                f"requesting service {LIGHT_DOMAIN}.{service}, {service_data} for "
+                f"{self.light_entity} from automation {self._attr_name}"
+            )
+            # Sent along with the calls of every other automation changed by the
+            # same update, unless the light is already in that state
+            get_actuator(self.hass).call(service, self.light_entity, service_data)
 
-            service_data = {
-                ATTR_ENTITY_ID: self._light_entity,
-            }
-            if service is None:
-                return True
-            elif service == SERVICE_TURN_ON:
-                if target.brightness:
-                    service_data[ATTR_BRIGHTNESS_PCT] = target.brightness.value
+        return changed
 
-            if target.transition is not None:
-                service_data[ATTR_TRANSITION] = target.transition.value
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        reconciler = get_reconciler(self.hass)
+        if reconciler.enabled:
+            reconciler.add(self)
+            self.async_on_remove(lambda: reconciler.remove(self))
 
-            _LOGGER.warning(
-                f"calling service {LIGHT_DOMAIN}.{service}, {service_data} for "
-                f"automation {self._attr_name}"
-            )
-            asyncio.run_coroutine_threadsafe(
-                self.hass.services.async_call(
-                    LIGHT_DOMAIN,
-                    service,
-                    service_data,
-                    blocking=False,
-                ),
-                self.hass.loop,
-            )
 
-        return True
+class MeshQueueSensor(SensorEntity):
+    """
+    The number of light commands waiting to be sent to a mesh, with how long
+    commands have been waiting as attributes
+    """
+
+    _attr_should_poll = False
+
+    def __init__(self, entity: Entity, mesh: MeshQueue) -> None:
+        super().__init__()
+        assert entity.domain.value == SENSOR_DOMAIN
+        self._attr_name = entity.name
+        self._attr_native_value = 0
+        self._mesh = mesh
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(self._mesh.add_listener(self._mesh_changed))
+
+    def _mesh_changed(self) -> None:
+        self._attr_native_value = len(self._mesh.queue)
+        self._attr_extra_state_attributes = self._mesh.metrics(self.hass.loop.time())
+        self.async_write_ha_state()
+
+
+class ReconcilerSensor(SensorEntity):
+    """
+    The number of lights found not in the state they were sent, with how many
+    of them were corrected as attributes
+    """
+
+    _attr_should_poll = False
+
+    def __init__(self, entity: Entity, reconciler: LightReconciler) -> None:
+        super().__init__()
+        assert entity.domain.value == SENSOR_DOMAIN
+        self._attr_name = entity.name
+        self._attr_native_value = 0
+        self._reconciler = reconciler
+
+    async def async_added_to_hass(self) -> None:
+        self._attr_extra_state_attributes = self._reconciler.metrics()
+        self.async_on_remove(self._reconciler.add_listener(self._reconciled))
+
+    def _reconciled(self) -> None:
+        self._attr_native_value = self._reconciler.divergent
+        self._attr_extra_state_attributes = self._reconciler.metrics()
+        self.async_write_ha_state()
@@ -0,0 +1,53 @@
+"""
+Typed values of the calculated entities, so they aren't parsed again on every hop.
+"""
+from typing import Any, Callable, Dict, Set, TypeVar
+
+from homeassistant.const import STATE_UNKNOWN
+from homeassistant.core import HomeAssistant
+
+
+DATA_STORE = "light_motion_profiles_store"
+
+V = TypeVar("V")
+
+
+class StateStore:
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._values: Dict[str, Any] = {}
+        # Entities kept out of the state machine
+        self._internal: Set[str] = set()
+
+    def set(self, entity_id: str, value: Any) -> None:
+        self._values[entity_id] = value
+
+    def add_internal(self, entity_id: str) -> None:
+        """
+        entity_id has no state in hass, until it has a value it reads as unknown
+        just like an entity that hasn't calculated anything yet
+        """
+        self._internal.add(entity_id)
+
+    def remove(self, entity_id: str) -> None:
+        self._values.pop(entity_id, None)
+        self._internal.discard(entity_id)
+
+    def get(self, entity_id: str, parse: Callable[[str], V]) -> V | None:
+        """
+        The typed value of entity_id. Entities that haven't calculated a value
+        yet, or aren't calculated by us at all, are parsed from the state machine
+        """
+        if entity_id in self._values:
+            return self._values[entity_id]
+        if entity_id in self._internal:
+            return parse(STATE_UNKNOWN)
+
+        state = self._hass.states.get(entity_id)
+        if state is None:
+            return None
+        return parse(state.state)
+
+
+def get_store(hass: HomeAssistant) -> StateStore:
+    return hass.data[DATA_STORE]
@@ -0,0 +1,189 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from ..actuator import LightActuator
+from ..datatypes import MeshSettings
+
+
+class ActuatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.calls = []
+
+        async def async_call(domain, service, data, blocking):
+            self.calls.append((service, data))
+
+        def async_create_task(coro, eager_start=False):
+            if eager_start:
+                # The fake service call never awaits so it's done straight away
+                try:
+                    coro.send(None)
+                except StopIteration:
+                    return None
+            return self.loop.create_task(coro)
+
+        self.states = {}
+        self.hass = SimpleNamespace(
+            loop=self.loop,
+            states=SimpleNamespace(get=self.states.get),
+            services=SimpleNamespace(async_call=async_call),
+            async_create_task=async_create_task,
+        )
+
+    def flush(self):
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+
+class TestLightActuator(ActuatorTestCase):
+    def test_batches_identical_commands(self):
+        actuator = LightActuator(self.hass)
+        actuator.call("turn_on", "light.a", {"brightness_pct": 50})
+        actuator.call("turn_on", "light.b", {"brightness_pct": 50})
+        actuator.call("turn_on", "light.c", {"brightness_pct": 10})
+        actuator.call("turn_off", "light.d", {})
+        self.assertEqual(self.calls, [])
+
+        self.flush()
+        self.assertEqual(
+            self.calls,
+            [
+                (
+                    "turn_on",
+                    {"brightness_pct": 50, "entity_id": ["light.a", "light.b"]},
+                ),
+                ("turn_on", {"brightness_pct": 10, "entity_id": ["light.c"]}),
+                ("turn_off", {"entity_id": ["light.d"]}),
+            ],
+        )
+
+    def test_latest_command_wins(self):
+        actuator = LightActuator(self.hass)
+        actuator.call("turn_on", "light.a", {})
+        actuator.call("turn_off", "light.a", {"transition": 0})
+        self.flush()
+        self.assertEqual(
+            self.calls, [("turn_off", {"transition": 0, "entity_id": ["light.a"]})]
+        )
+
+    def test_skips_lights_already_in_state(self):
+        self.states["light.a"] = SimpleNamespace(state="off", attributes={})
+        self.states["light.b"] = SimpleNamespace(
+            state="on", attributes={"brightness": 128}
+        )
+        actuator = LightActuator(self.hass)
+        actuator.call("turn_off", "light.a", {})
+        actuator.call("turn_on", "light.b", {"brightness_pct": 50})
+        actuator.call("turn_on", "light.b", {})
+        self.flush()
+        self.assertEqual(self.calls, [])
+
+        actuator.call("turn_on", "light.b", {"brightness_pct": 100})
+        self.flush()
+        self.assertEqual(
+            self.calls, [("turn_on", {"brightness_pct": 100, "entity_id": ["light.b"]})]
+        )
+
+    def test_skips_command_in_flight(self):
+        actuator = LightActuator(self.hass)
+        actuator.call("turn_on", "light.a", {"transition": 5})
+        self.flush()
+        # The light hasn't reported back yet
+        actuator.call("turn_on", "light.a", {"transition": 5})
+        self.flush()
+        self.assertEqual(len(self.calls), 1)
+
+        actuator.call("turn_off", "light.a", {"transition": 5})
+        self.flush()
+        self.assertEqual(len(self.calls), 2)
+
+    def test_sends_over_command_in_flight(self):
+        self.states["light.a"] = SimpleNamespace(state="on", attributes={})
+        actuator = LightActuator(self.hass)
+        actuator.call("turn_off", "light.a", {"transition": 5})
+        self.flush()
+        # Motion is back before the light reports off, it still reads on
+        actuator.call("turn_on", "light.a", {})
+        self.flush()
+        self.assertEqual(
+            self.calls,
+            [
+                ("turn_off", {"transition": 5, "entity_id": ["light.a"]}),
+                ("turn_on", {"entity_id": ["light.a"]}),
+            ],
+        )
+
+    def test_flush_sends_straight_away(self):
+        actuator = LightActuator(self.hass)
+        actuator.call("turn_on", "light.a", {})
+        actuator.flush()
+        self.assertEqual(self.calls, [("turn_on", {"entity_id": ["light.a"]})])
+
+        # Nothing is left for the end of the loop iteration
+        actuator.flush()
+        self.flush()
+        self.assertEqual(len(self.calls), 1)
+
+
+class TestMeshes(ActuatorTestCase):
+    def actuator(self, rate=20.0, burst=1):
+        mesh = MeshSettings(lights=["light.zigbee_*"], rate=rate, burst=burst)
+        return LightActuator(self.hass, {"zigbee": mesh})
+
+    def sent(self):
+        return [e for _, data in self.calls for e in data["entity_id"]]
+
+    def test_rate_limited(self):
+        actuator = self.actuator(burst=2)
+        for i in range(4):
+            actuator.call("turn_on", f"light.zigbee_{i}", {})
+        actuator.call("turn_on", "light.wifi", {})
+        self.flush()
+        self.assertEqual(
+            self.sent(), ["light.wifi", "light.zigbee_0", "light.zigbee_1"]
+        )
+        self.assertEqual(len(actuator.meshes["zigbee"].queue), 2)
+
+        self.loop.run_until_complete(asyncio.sleep(0.2))
+        self.assertEqual(self.sent()[3:], ["light.zigbee_2", "light.zigbee_3"])
+        metrics = actuator.meshes["zigbee"].metrics(self.loop.time())
+        self.assertEqual(metrics["sent"], 4)
+        self.assertGreater(metrics["max_wait"], 0)
+
+    def test_turn_on_first_and_latest_wins(self):
+        actuator = self.actuator()
+        actuator.call("turn_off", "light.zigbee_0", {})
+        actuator.call("turn_off", "light.zigbee_1", {})
+        actuator.call("turn_off", "light.zigbee_2", {})
+        self.flush()
+        actuator.call("turn_on", "light.zigbee_2", {})
+        actuator.call("turn_on", "light.zigbee_1", {"brightness_pct": 10})
+        actuator.call("turn_on", "light.zigbee_1", {"brightness_pct": 20})
+        self.flush()
+
+        self.loop.run_until_complete(asyncio.sleep(0.2))
+        self.assertEqual(
+            self.calls,
+            [
+                ("turn_off", {"entity_id": ["light.zigbee_0"]}),
+                ("turn_on", {"brightness_pct": 20, "entity_id": ["light.zigbee_1"]}),
+                ("turn_on", {"entity_id": ["light.zigbee_2"]}),
+            ],
+        )
+        self.assertEqual(actuator.meshes["zigbee"].superseded, 2)
+
+    def test_requeued_command_isnt_superseded(self):
+        actuator = self.actuator()
+        actuator.call("turn_off", "light.zigbee_0", {})
+        actuator.call("turn_off", "light.zigbee_1", {})
+        self.flush()
+        actuator.call("turn_off", "light.zigbee_1", {})
+        self.flush()
+        self.assertEqual(self.sent(), ["light.zigbee_0"])
+        self.assertEqual(actuator.meshes["zigbee"].superseded, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
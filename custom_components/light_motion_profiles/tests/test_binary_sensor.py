@@ -0,0 +1,85 @@
+import unittest
+from types import SimpleNamespace
+
+from ..binary_sensor import MotionGroup
+from ..datatypes.entity import Domain, Entity, InputEntity
+
+SENSORS = ["binary_sensor.a", "binary_sensor.b", "binary_sensor.c"]
+
+
+def state_changed(entity_id, new):
+    new_state = None if new is None else SimpleNamespace(state=new, attributes={})
+    return SimpleNamespace(data={"entity_id": entity_id, "new_state": new_state})
+
+
+class TestMotionGroup(unittest.TestCase):
+    def setUp(self):
+        self.states = {e: SimpleNamespace(state="off") for e in SENSORS}
+        config = SimpleNamespace(
+            motion_sensor_group_entity=Entity(
+                Domain.BINARY_SENSOR, "motion_sensor_group_x"
+            ),
+            occupancy_sensors=[InputEntity(e) for e in SENSORS],
+        )
+        self.group = MotionGroup(config)
+        self.group.hass = SimpleNamespace(states=SimpleNamespace(get=self.states.get))
+
+    def change(self, entity_id, new):
+        """
+        Changes the state the way hass would, then sends the group the event
+        """
+        if new is None:
+            self.states.pop(entity_id, None)
+        else:
+            self.states[entity_id] = SimpleNamespace(state=new)
+        self.group._input_changed(state_changed(entity_id, new))
+
+    def test_startup_scan(self):
+        self.states["binary_sensor.b"] = SimpleNamespace(state="on")
+        # Events before the first scan are left for the scan to pick up
+        self.change("binary_sensor.c", "on")
+        self.assertIsNone(self.group._sensors_on)
+
+        self.assertTrue(self.group.calculate_current_state())
+        self.assertEqual(self.group._sensors_on, {"binary_sensor.b", "binary_sensor.c"})
+
+    def test_counts_on_and_off(self):
+        self.assertFalse(self.group.calculate_current_state())
+        self.change("binary_sensor.a", "on")
+        self.change("binary_sensor.b", "on")
+        self.assertTrue(self.group.calculate_current_state())
+
+        self.change("binary_sensor.a", "off")
+        self.assertTrue(self.group.calculate_current_state())
+        self.change("binary_sensor.b", "off")
+        self.assertFalse(self.group.calculate_current_state())
+
+    def test_duplicate_on(self):
+        self.assertFalse(self.group.calculate_current_state())
+        self.change("binary_sensor.a", "on")
+        self.change("binary_sensor.a", "on")
+        self.change("binary_sensor.a", "off")
+        self.assertFalse(self.group.calculate_current_state())
+
+    def test_unavailable_rescans(self):
+        self.assertFalse(self.group.calculate_current_state())
+        self.change("binary_sensor.a", "on")
+        self.change("binary_sensor.b", "on")
+
+        self.change("binary_sensor.a", "unavailable")
+        self.assertIsNone(self.group._sensors_on)
+        self.assertTrue(self.group.calculate_current_state())
+        self.assertEqual(self.group._sensors_on, {"binary_sensor.b"})
+
+        self.change("binary_sensor.b", None)
+        self.assertIsNone(self.group._sensors_on)
+        self.assertFalse(self.group.calculate_current_state())
+
+        # Tracked incrementally again once rescanned
+        self.change("binary_sensor.a", "on")
+        self.assertEqual(self.group._sensors_on, {"binary_sensor.a"})
+        self.assertTrue(self.group.calculate_current_state())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import copy
+import itertools
+import unittest
+
+from ..coverage import (
+    _expand,
+    dead_rules,
+    merge,
+    minimize,
+    prune_dead_rules,
+    subtract,
+    unassigned_cubes,
+)
+from ..exhaustive import build_truth_table
+from .test_exhaustive import CONFIG, build_config
+
+
+def bits(mask):
+    return [i for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+class TestCubes(unittest.TestCase):
+    def test_subtract(self):
+        a = (0b111, 0b11)
+        b = (0b010, 0b01)
+        pieces = subtract(a, b)
+        points = {p for c in pieces for p in itertools.product(bits(c[0]), bits(c[1]))}
+        expected = set(itertools.product([0, 1, 2], [0, 1])) - {(1, 0)}
+        self.assertEqual(points, expected)
+        self.assertEqual(sum(len(bits(c[0])) * len(bits(c[1])) for c in pieces), 5)
+
+    def test_merge(self):
+        self.assertEqual(merge([(0b01, 0b1), (0b10, 0b1)]), [(0b11, 0b1)])
+        self.assertEqual(
+            sorted(merge([(0b01, 0b01), (0b10, 0b10)])), [(0b01, 0b01), (0b10, 0b10)]
+        )
+
+
+class TestSymbolicUnassigned(unittest.TestCase):
+    def test_expand_adds_every_value_that_fits(self):
+        # Only value 1 of the first dimension is off limits, both 2 and 3 can be
+        # added to the cube on their own
+        off = [(0b0010, 0b1)]
+        self.assertEqual(_expand((0b0001, 0b1), [4, 1], off), (0b1101, 0b1))
+        self.assertEqual(
+            minimize([(0b0001, 0b1), (0b0100, 0b1), (0b1000, 0b1)], [4, 1], off),
+            [(0b1101, 0b1)],
+        )
+
+    def test_same_as_enumerated(self):
+        config = build_config()
+        group = config.lights["hall"]
+        space, cubes = unassigned_cubes(group, config)
+
+        found = set()
+        for cube in cubes:
+            for room, occupancy, *options in itertools.product(*map(bits, cube)):
+                user_state = []
+                for names, domain, i in zip(
+                    space.components, space.component_domains, options
+                ):
+                    user_state += zip(names, domain[i])
+                found.add(
+                    (
+                        space.room_states[room],
+                        space.occupancy_states[occupancy],
+                        tuple(sorted(user_state)),
+                    )
+                )
+
+        table = build_truth_table(group, config, use_numpy=False)
+        expected = set()
+        for i in table.unassigned():
+            user_state = [
+                (u, int(c[i])) for u, c in zip(table.users, table.user_states)
+            ]
+            expected.add(
+                (
+                    table.room_states[table.room[i]],
+                    table.occupancy_states[table.occupancy[i]],
+                    tuple(sorted(user_state)),
+                )
+            )
+
+        self.assertTrue(expected)
+        self.assertEqual(found, expected)
+
+
+class TestDeadRules(unittest.TestCase):
+    def build_config(self):
+        raw = copy.deepcopy(CONFIG)
+        rules = raw["light_configs"]["hall"]["light_profile_rules"]
+        rules.append(dict(rules[0], state_name="absent_again"))
+        rules.append(dict(rules[0], state_name="never", room_state="manual"))
+        rules[-1]["user_state"] = [
+            {"user": "nick", "state_any": "asleep"},
+            {"user": "nick", "state_any": "awake"},
+        ]
+        return build_config(raw)
+
+    def test_dead_rules(self):
+        config = self.build_config()
+        group = config.lights["hall"]
+        dead = dead_rules(group, config)
+
+        shadowed_by = {
+            d.rule.state_name: [r.state_name for r in d.shadowed_by] for d in dead
+        }
+        self.assertIn("absent", shadowed_by["absent_again"])
+        self.assertEqual(shadowed_by["never"], [])
+
+        table = build_truth_table(group, config, use_numpy=False)
+        self.assertEqual(
+            {d.index for d in dead},
+            set(range(len(group.rules))) - {int(r) for r in table.rule},
+        )
+
+    def test_prune(self):
+        config = self.build_config()
+        prune_dead_rules(config)
+        names = [r.state_name for r in config.lights["hall"].rules]
+        self.assertNotIn("absent_again", names)
+        self.assertNotIn("never", names)
+
+    def test_prune_keeps_rules_for_unconfigured_states(self):
+        raw = copy.deepcopy(CONFIG)
+        rules = raw["light_configs"]["hall"]["light_profile_rules"]
+        rules.insert(
+            0,
+            dict(
+                rules[0],
+                state_name="nick_unavailable",
+                room_state="*",
+                user_state=[{"user": "nick", "state_exact": "unavailable"}],
+            ),
+        )
+        rules.insert(0, dict(rules[-1], state_name="cleaning", room_state="cleaning"))
+        config = build_config(raw)
+        prune_dead_rules(config)
+        names = [r.state_name for r in config.lights["hall"].rules]
+        # Neither can match a configured state but both win for the ones they name
+        self.assertEqual(names[:2], ["cleaning", "nick_unavailable"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import asyncio
+import json
+import unittest
+
+from ..dashboards import MotionDebugDashboard, PresenceDebugDashboard
+from .test_sensor import internal_config
+
+
+class TestDashboards(unittest.TestCase):
+    def test_leave_out_internal_entities(self):
+        config = internal_config()
+        hall = config.lights["hall"]
+        rendered = json.dumps(asyncio.run(MotionDebugDashboard(config).render()))
+        self.assertNotIn("internal.", rendered)
+        self.assertIn(hall.room_occupancy_entity.full, rendered)
+        self.assertIn(hall.occupancy_sensors[0].entity, rendered)
+
+        users_groups = config.users_groups
+        dashboard = PresenceDebugDashboard(users_groups)
+        rendered = json.dumps(asyncio.run(dashboard.render()))
+        self.assertNotIn("internal.", rendered)
+        self.assertIn(users_groups.groups["everyone"].presence_entity.full, rendered)
+
+
+if __name__ == "__main__":
+    unittest.main()
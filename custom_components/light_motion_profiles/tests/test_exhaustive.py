@@ -0,0 +1,319 @@
+import copy
+import itertools
+import unittest
+from unittest import mock
+
+from .. import build_domains, exhaustive
+from ..config import RawConfig
+from ..datatypes import Config
+from ..exhaustive import (
+    RuleUserDomains,
+    UserCombinator,
+    build_decision_table,
+    build_truth_table,
+    build_truth_tables,
+    cell_states,
+    gen_light_group_matches,
+    gen_light_group_matches_by_cell,
+    product_range,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+CONFIG = {
+    "settings": {
+        "room": {"valid_room_states": ["auto", "manual"]},
+        "user_group": {"valid_person_states": ["awake", "winddown", "asleep"]},
+    },
+    "users": {
+        "nick": {"guest": False},
+        "partner": {"guest": False},
+        "guest_1": {"guest": True},
+        "guest_2": {"guest": True},
+        "guest_3": {"guest": True},
+    },
+    "groups": {
+        "guests": ["guest_1", "guest_2", "guest_3"],
+        "everyone": ["nick", "partner", "guests"],
+    },
+    "light_profiles": {
+        "on": {"enabled": True},
+        "off": {"enabled": False},
+        "dim": {"enabled": True, "brightness_pct": 10},
+        "noop": {},
+    },
+    "templates": {"light_config_rules": {}},
+    "light_configs": {
+        "hall": {
+            "lights": "light.hall",
+            "occupancy_sensors": ["binary_sensor.a", "binary_sensor.b"],
+            "occupancy_timeout": 60,
+            "user": "everyone",
+            "light_profile_rules": [
+                {
+                    "state_name": "absent",
+                    "room_state": "auto",
+                    "occupancy": "*",
+                    "user_state": [{"user": "everyone", "state_exact": "absent"}],
+                    "light_profile": "off",
+                },
+                {
+                    "state_name": "nick_asleep",
+                    "room_state": "auto",
+                    "occupancy": ["occupied", "occupied_timeout"],
+                    "user_state": [
+                        {"user": "nick", "state_any": "asleep"},
+                        {"user": "everyone", "state_all": ["asleep", "absent"]},
+                    ],
+                    "light_profile": "dim",
+                },
+                {
+                    "state_name": "someone_awake",
+                    "room_state": "auto",
+                    "occupancy": "occupied",
+                    "user_state": [{"user": "everyone", "state_any": "awake"}],
+                    "light_profile": "on",
+                },
+                {
+                    "state_name": "partner_winddown",
+                    "room_state": "*",
+                    "occupancy": "*",
+                    "user_state": [
+                        {"user": "partner", "state_exact": ["winddown", "asleep"]}
+                    ],
+                    "light_profile": "noop",
+                },
+                {
+                    "state_name": "empty",
+                    "room_state": "auto",
+                    "occupancy": "empty",
+                    "user_state": "*",
+                    "light_profile": "off",
+                },
+            ],
+        },
+    },
+}
+
+
+def build_config(config=CONFIG) -> Config:
+    data = RawConfig.vol()(config)
+    raw = RawConfig.from_yaml(data)
+    return Config(raw, build_domains(raw.settings.internal_entities))
+
+
+def project(combination, rule_users):
+    return tuple(sorted((k, v) for k, v in combination.items() if k in rule_users))
+
+
+def scan(group, room_state, occupancy, user_state):
+    for rule in group.rules:
+        if rule.rule_match.match(room_state, occupancy, user_state):
+            return rule.state_name
+    return None
+
+
+class TestDecisionTable(unittest.TestCase):
+    def test_matches_rule_scan(self):
+        config = build_config()
+        group = config.lights["hall"]
+        table = build_decision_table(group, config)
+
+        encoding = config.settings.state_encoding
+        results = list(gen_light_group_matches(group, config))
+        self.assertEqual(len(table.decisions), len(results))
+        for result in results:
+            user_state = {u: encoding.encode(s) for u, s in result.user_state.items()}
+            self.assertEqual(
+                table.lookup(result.room, result.occupancy, user_state),
+                scan(group, result.room, result.occupancy, user_state),
+            )
+            self.assertEqual(
+                table.lookup(result.room, result.occupancy, user_state),
+                result.rule_name,
+            )
+
+    def test_unknown_state(self):
+        config = build_config()
+        table = build_decision_table(config.lights["hall"], config)
+        encoding = config.settings.state_encoding
+        user_states = {
+            "nick": encoding.bit("awake"),
+            "partner": encoding.bit("awake"),
+            "everyone": encoding.bit("awake"),
+        }
+        self.assertEqual(table.lookup("auto", "occupied", user_states), "someone_awake")
+
+        with self.assertRaises(KeyError):
+            table.lookup("auto", "unavailable", user_states)
+
+        with self.assertRaises(KeyError):
+            table.lookup(
+                "auto", "occupied", dict(user_states, nick=encoding.bit("unknown"))
+            )
+
+
+class TestRuleUserDomains(unittest.TestCase):
+    def test_group_domain(self):
+        config = build_config()
+        encoding = config.settings.state_encoding
+        domains = RuleUserDomains(
+            users_groups=config.users_groups,
+            single_person_states=encoding.person_states,
+            absent_state=encoding.absent,
+        )
+        self.assertEqual(len(domains.group_domain(1)), 4)
+        self.assertEqual(len(domains.group_domain(2)), 3 + 3 + 1)
+        self.assertEqual(len(domains.group_domain(5)), 7 + 1)
+
+    def test_matches_combinator(self):
+        config = build_config()
+        encoding = config.settings.state_encoding
+        domains = RuleUserDomains(
+            users_groups=config.users_groups,
+            single_person_states=encoding.person_states,
+            absent_state=encoding.absent,
+        )
+        combinator = UserCombinator(
+            users_groups=config.users_groups,
+            single_person_states=encoding.person_states,
+            absent_state=encoding.absent,
+        )
+        everyone = config.users_groups.get("everyone")
+
+        for rule_users in [
+            set(),
+            {"nick"},
+            {"guests"},
+            {"nick", "guests"},
+            {"guest_1", "guests"},
+            {"nick", "partner", "everyone"},
+            {"guest_2", "guests", "everyone"},
+        ]:
+            expected = {
+                project(combination, rule_users)
+                for combination in combinator.combinations_for_target(everyone)
+            }
+            found = [
+                project(combination, rule_users)
+                for combination in domains.combinations_for_rule_users(rule_users)
+            ]
+            self.assertEqual(len(found), len(set(found)), rule_users)
+            self.assertEqual(set(found), expected, rule_users)
+
+
+class TestMatchesByCell(unittest.TestCase):
+    def test_same_as_sorted(self):
+        config = build_config()
+        group = config.lights["hall"]
+        expected = sorted(
+            gen_light_group_matches(group, config), key=lambda r: (r.room, r.occupancy)
+        )
+        self.assertEqual(list(gen_light_group_matches_by_cell(group, config)), expected)
+
+    def test_same_as_rule_scan(self):
+        raw = copy.deepcopy(CONFIG)
+        rules = raw["light_configs"]["hall"]["light_profile_rules"]
+        # Overlaps the rules either side of it and is partly shadowed itself
+        rules.insert(
+            2,
+            {
+                "state_name": "anyone_up",
+                "room_state": "*",
+                "occupancy": ["occupied", "empty"],
+                "user_state": [
+                    {"user": "everyone", "state_any": ["awake", "winddown"]}
+                ],
+                "light_profile": "on",
+            },
+        )
+        rules.append(dict(rules[0], state_name="anything", occupancy="*"))
+        rules[-1]["user_state"] = "*"
+        config = build_config(raw)
+        group = config.lights["hall"]
+        encoding = config.settings.state_encoding
+        combinator = UserCombinator(
+            users_groups=config.users_groups,
+            single_person_states=encoding.person_states,
+            absent_state=encoding.absent,
+        )
+        rule_users = group.get_rule_users()
+        user_states = {
+            project(combination, rule_users)
+            for combination in combinator.combinations_for_target(
+                config.users_groups.get("everyone")
+            )
+        }
+        room_states, occupancy_states = cell_states(config)
+
+        expected = [
+            (
+                room,
+                occupancy,
+                user_state,
+                scan(group, room, occupancy, dict(user_state)),
+            )
+            for room in room_states
+            for occupancy in occupancy_states
+            for user_state in user_states
+        ]
+        found = [
+            (
+                r.room,
+                r.occupancy,
+                tuple(sorted((u, encoding.encode(s)) for u, s in r.user_state.items())),
+                r.rule_name,
+            )
+            for r in gen_light_group_matches_by_cell(group, config)
+        ]
+        self.assertEqual(len(found), len(expected))
+        self.assertEqual(set(found), set(expected))
+
+
+class TestTruthTable(unittest.TestCase):
+    def check_backend(self, use_numpy):
+        config = build_config()
+        group = config.lights["hall"]
+        expected = list(gen_light_group_matches(group, config))
+        table = build_truth_table(group, config, use_numpy=use_numpy)
+        self.assertEqual(len(table), len(expected))
+        self.assertEqual(list(table.rows(config)), expected)
+        self.assertEqual(
+            [table.row(i, config) for i in table.unassigned()],
+            [r for r in expected if r.rule_name is None],
+        )
+
+    def test_python(self):
+        self.check_backend(use_numpy=False)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        self.check_backend(use_numpy=True)
+
+    def test_product_range(self):
+        domains = [[1, 2], [3], [4, 5, 6]]
+        expected = list(itertools.product(*domains))
+        for start in range(len(expected) + 1):
+            for stop in range(start, len(expected) + 2):
+                self.assertEqual(
+                    list(product_range(domains, start, stop)), expected[start:stop]
+                )
+
+    @mock.patch.object(exhaustive, "MIN_CHUNK_COMBINATIONS", 1)
+    def test_parallel(self):
+        config = build_config()
+        expected = build_truth_tables(config, use_numpy=False)
+        tables = build_truth_tables(config, use_numpy=False, jobs=3)
+        self.assertEqual(list(tables), list(expected))
+        for name, table in tables.items():
+            self.assertEqual(
+                list(table.rows(config)), list(expected[name].rows(config))
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from ..graph import DependencyGraph
+
+
+class FakeNode:
+    def __init__(self, entity_id, dependencies, calls, changes=True, graph=None):
+        self.entity_id = entity_id
+        self._dependent_entities = dependencies
+        self._calls = calls
+        self._changes = changes
+        self._graph = graph
+
+    def _force_update(self, event):
+        self._calls.append(self.entity_id)
+        if self._changes and self._graph is not None:
+            self._graph.publish(self)
+        return self._changes
+
+    def async_write_ha_state(self):
+        self._calls.append(f"write {self.entity_id}")
+
+    def _input_changed(self, event):
+        self._calls.append(f"{self.entity_id}<-{event.data['entity_id']}")
+
+
+def build_graph(unchanged=(), loop=None, debounce=0.0, fast_inputs=()):
+    calls = []
+    graph = DependencyGraph(
+        ["sensor.a", "sensor.b", "sensor.c", "sensor.d"], loop, debounce, fast_inputs
+    )
+    nodes = {
+        "sensor.a": ["input.x"],
+        "sensor.b": ["sensor.a"],
+        "sensor.c": ["sensor.a", "sensor.b"],
+        "sensor.d": ["sensor.c", "input.y"],
+    }
+    # Add them out of order, the graph shouldn't care
+    out = {}
+    for entity_id in reversed(nodes):
+        # Only nodes of a graph with fast inputs record their writes
+        node = FakeNode(
+            entity_id,
+            nodes[entity_id],
+            calls,
+            entity_id not in unchanged,
+            graph if fast_inputs else None,
+        )
+        graph.add(node)
+        out[entity_id] = node
+    return graph, out, calls
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def test_topological_single_pass(self):
+        graph, nodes, calls = build_graph()
+        graph.update(nodes["sensor.a"])
+        self.assertEqual(calls, ["sensor.a", "sensor.b", "sensor.c", "sensor.d"])
+
+    def test_stops_when_unchanged(self):
+        graph, nodes, calls = build_graph(unchanged=["sensor.b"])
+        graph.update(nodes["sensor.b"])
+        self.assertEqual(calls, ["sensor.b"])
+
+    def test_changed(self):
+        graph, nodes, calls = build_graph()
+        graph.changed(nodes["sensor.c"])
+        self.assertEqual(calls, ["sensor.d"])
+
+    def test_external_inputs(self):
+        graph, _, _ = build_graph()
+        self.assertTrue(graph.is_calculated("sensor.a"))
+        self.assertFalse(graph.is_calculated("input.x"))
+
+
+class TestScheduling(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_coalesces_same_iteration(self):
+        graph, nodes, calls = build_graph(loop=self.loop)
+        graph.schedule(nodes["sensor.d"])
+        graph.schedule(nodes["sensor.a"])
+        graph.schedule(nodes["sensor.d"])
+        self.assertEqual(calls, [])
+
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(calls, ["sensor.a", "sensor.b", "sensor.c", "sensor.d"])
+
+    def test_debounce(self):
+        graph, nodes, calls = build_graph(loop=self.loop, debounce=0.05)
+        graph.schedule(nodes["sensor.d"])
+        self.loop.run_until_complete(asyncio.sleep(0))
+        graph.schedule(nodes["sensor.b"])
+        self.assertEqual(calls, [])
+
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertEqual(calls, ["sensor.b", "sensor.c", "sensor.d"])
+
+    def test_changed_leaves_debounced(self):
+        graph, nodes, calls = build_graph(loop=self.loop, debounce=0.05)
+        graph.schedule(nodes["sensor.a"])
+        graph.changed(nodes["sensor.c"])
+        self.assertEqual(calls, ["sensor.d"])
+
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertEqual(
+            calls, ["sensor.d", "sensor.a", "sensor.b", "sensor.c", "sensor.d"]
+        )
+
+
+def state_changed(entity_id, old, new):
+    return SimpleNamespace(
+        data={
+            "entity_id": entity_id,
+            "old_state": SimpleNamespace(state=old, attributes={}),
+            "new_state": SimpleNamespace(state=new, attributes={"x": 1}),
+        }
+    )
+
+
+class TestDispatch(unittest.TestCase):
+    def test_fans_out_inputs(self):
+        graph, _, calls = build_graph()
+        graph.async_state_changed(state_changed("input.y", "off", "on"))
+        self.assertEqual(calls, ["sensor.d<-input.y", "sensor.d"])
+
+        calls.clear()
+        graph.async_state_changed(state_changed("input.x", "off", "on"))
+        self.assertEqual(
+            calls, ["sensor.a<-input.x", "sensor.a", "sensor.b", "sensor.c", "sensor.d"]
+        )
+
+    def test_ignores_attribute_changes_and_unknown_entities(self):
+        graph, _, calls = build_graph()
+        graph.async_state_changed(state_changed("input.x", "on", "on"))
+        graph.async_state_changed(state_changed("input.z", "off", "on"))
+        # Calculated entities are pushed through the graph, not dispatched
+        graph.async_state_changed(state_changed("sensor.a", "off", "on"))
+        self.assertEqual(calls, [])
+
+    def test_fast_input(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        graph, _, calls = build_graph(loop=loop, debounce=1, fast_inputs=["input.y"])
+        graph.add_fast_pass_hook(lambda: calls.append("hook"))
+
+        # Runs straight away and the writes wait for the hook
+        graph.async_state_changed(state_changed("input.y", "off", "on"))
+        self.assertEqual(calls, ["sensor.d<-input.y", "sensor.d", "hook"])
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(calls[3:], ["write sensor.d"])
+
+        calls.clear()
+        graph.async_state_changed(state_changed("input.x", "off", "on"))
+        self.assertEqual(calls, ["sensor.a<-input.x"])
+
+    def test_event_filter(self):
+        graph, nodes, _ = build_graph()
+        self.assertTrue(graph.async_is_input(state_changed("input.y", "off", "on")))
+        self.assertFalse(graph.async_is_input(state_changed("input.z", "off", "on")))
+        self.assertFalse(graph.async_is_input(state_changed("sensor.a", "off", "on")))
+        # Newer versions of hass only pass the event data
+        self.assertTrue(graph.async_is_input({"entity_id": "input.x"}))
+
+        graph.remove(nodes["sensor.d"])
+        self.assertFalse(graph.async_is_input(state_changed("input.y", "off", "on")))
+
+    def test_removed(self):
+        graph, nodes, calls = build_graph()
+        graph.remove(nodes["sensor.d"])
+        graph.async_state_changed(state_changed("input.y", "off", "on"))
+        self.assertEqual(calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from ..actuator import LightActuator
+from ..reconciler import LightReconciler
+from .test_actuator import ActuatorTestCase
+
+
+class FakeAutomation:
+    def __init__(self, light_entity, command):
+        self.light_entity = light_entity
+        self.command = command
+
+    def reconcile_command(self):
+        return self.command
+
+
+class TestLightReconciler(ActuatorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.actuator = LightActuator(self.hass)
+        self.reconciler = LightReconciler(self.hass, self.actuator, 0.01, 2)
+        self.automations = {}
+        for name in ["light.a", "light.b", "light.c"]:
+            self.states[name] = SimpleNamespace(state="off", attributes={})
+            automation = FakeAutomation(name, ("turn_off", {}))
+            self.automations[name] = automation
+            self.reconciler.add(automation)
+
+    def test_walks_lights_in_batches(self):
+        self.reconciler.tick()
+        self.assertEqual(self.reconciler.checked, 2)
+        self.reconciler.tick()
+        self.assertEqual(self.reconciler.checked, 3)
+        self.reconciler.tick()
+        self.assertEqual(self.reconciler.checked, 5)
+
+    def test_reissues_divergent_commands(self):
+        self.states["light.b"] = SimpleNamespace(state="on", attributes={})
+        self.reconciler.tick()
+        self.flush()
+        self.assertEqual(self.calls, [("turn_off", {"entity_id": ["light.b"]})])
+        self.assertEqual(self.reconciler.divergent, 1)
+        self.assertEqual(self.reconciler.corrected, 0)
+
+        self.states["light.b"] = SimpleNamespace(state="off", attributes={})
+        self.reconciler.tick()
+        self.reconciler.tick()
+        self.assertEqual(self.reconciler.divergent, 1)
+        self.assertEqual(self.reconciler.corrected, 1)
+
+    def test_skips_unmanaged_and_unavailable_lights(self):
+        self.states["light.a"] = SimpleNamespace(state="on", attributes={})
+        self.automations["light.a"].command = None
+        self.states["light.b"] = SimpleNamespace(state="unavailable", attributes={})
+        self.reconciler.tick()
+        self.flush()
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.reconciler.checked, 0)
+
+    def test_doesnt_resend_in_flight(self):
+        self.states["light.a"] = SimpleNamespace(state="on", attributes={})
+        self.reconciler.add(FakeAutomation("light.a", ("turn_off", {})))
+        for _ in range(4):
+            self.reconciler.tick()
+            self.flush()
+        self.assertEqual(self.calls, [("turn_off", {"entity_id": ["light.a"]})])
+        self.assertEqual(self.reconciler.divergent, 1)
+
+    def test_start(self):
+        self.states["light.a"] = SimpleNamespace(state="on", attributes={})
+        stop = self.reconciler.start()
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        stop()
+        self.flush()
+        self.assertEqual(self.calls, [("turn_off", {"entity_id": ["light.a"]})])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import asyncio
+import copy
+import unittest
+from types import SimpleNamespace
+
+from ..actuator import LightActuator
+from ..binary_sensor import MotionGroup
+from ..datatypes.entity import Domain
+from ..graph import DATA_GRAPH, DependencyGraph
+from ..reconciler import LightReconciler
+from ..sensor import CalculatedSensor, async_add_calculated, diagnostic_sensors
+from ..store import DATA_STORE, StateStore
+from .test_actuator import ActuatorTestCase
+from .test_exhaustive import CONFIG, build_config
+from .test_graph import FakeNode
+
+
+class FakeSensor(CalculatedSensor[str]):
+    def __init__(self, hass, entity_id, icons, writes):
+        super().__init__()
+        self.hass = hass
+        self.entity_id = entity_id
+        self._attr_name = entity_id
+        self._dependent_entities = []
+        self._icons = icons
+        self._writes = writes
+        self.value = "off"
+
+    def calculate_current_state(self):
+        return self.value
+
+    def async_write_ha_state(self):
+        self._writes.append(self.entity_id)
+
+
+class TestChangeDetection(unittest.TestCase):
+    def setUp(self):
+        self.writes = []
+        self.calls = []
+        self.hass = SimpleNamespace(
+            data={}, states=SimpleNamespace(get=lambda entity_id: None)
+        )
+        graph = DependencyGraph(["sensor.a", "sensor.b"])
+        self.hass.data[DATA_GRAPH] = graph
+        self.hass.data[DATA_STORE] = StateStore(self.hass)
+
+        self.icons = {"on": "mdi:on", "off": "mdi:off"}
+        self.sensor = FakeSensor(self.hass, "sensor.a", self.icons, self.writes)
+        graph.add(self.sensor)
+        graph.add(FakeNode("sensor.b", ["sensor.a"], self.calls))
+        graph.update(self.sensor)
+        self.writes.clear()
+        self.calls.clear()
+
+    def test_unchanged_isnt_written(self):
+        self.hass.data[DATA_GRAPH].update(self.sensor)
+        self.assertEqual(self.writes, [])
+        # Nothing downstream is recalculated either
+        self.assertEqual(self.calls, [])
+
+    def test_changed_value(self):
+        self.sensor.value = "on"
+        self.hass.data[DATA_GRAPH].update(self.sensor)
+        self.assertEqual(self.writes, ["sensor.a"])
+        self.assertEqual(self.sensor._attr_icon, "mdi:on")
+        self.assertEqual(self.calls, ["sensor.b"])
+
+    def test_changed_icon_alone(self):
+        self.icons["off"] = "mdi:other"
+        self.hass.data[DATA_GRAPH].update(self.sensor)
+        self.assertEqual(self.writes, ["sensor.a"])
+        self.assertEqual(self.sensor._attr_icon, "mdi:other")
+
+
+def internal_config():
+    raw = copy.deepcopy(CONFIG)
+    raw["settings"]["internal_entities"] = [
+        "person_presence",
+        "motion_sensor_group",
+        "light_rule",
+    ]
+    return build_config(raw)
+
+
+class TestInternalEntities(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.states = {
+            "binary_sensor.a": SimpleNamespace(state="on"),
+            "binary_sensor.b": SimpleNamespace(state="off"),
+        }
+        self.hass = SimpleNamespace(
+            data={}, states=SimpleNamespace(get=self.states.get)
+        )
+        self.config = internal_config()
+        hall = self.config.lights["hall"]
+        self.motion_entity = hall.motion_sensor_group_entity.full
+
+        graph = DependencyGraph([self.motion_entity])
+        self.hass.data[DATA_GRAPH] = graph
+        self.hass.data[DATA_STORE] = StateStore(self.hass)
+        graph.add(FakeNode("sensor.room", [self.motion_entity], self.calls))
+
+    def test_domains(self):
+        hall = self.config.lights["hall"]
+        self.assertEqual(hall.motion_sensor_group_entity.domain, Domain.INTERNAL)
+        self.assertTrue(self.motion_entity.startswith("internal."))
+        self.assertEqual(hall.light_rule_entity.domain, Domain.INTERNAL)
+        self.assertEqual(hall.room_occupancy_entity.domain, Domain.SENSOR)
+
+    def test_only_added_to_graph(self):
+        group = MotionGroup(self.config.lights["hall"])
+        group.async_write_ha_state = lambda: self.calls.append("write")
+        added = []
+        asyncio.run(async_add_calculated(self.hass, added.extend, [group]))
+
+        self.assertEqual(added, [])
+        self.assertEqual(group.entity_id, self.motion_entity)
+        self.assertTrue(group.is_on)
+        # Never written to hass, but what it depends on is recalculated
+        self.assertEqual(self.calls, ["sensor.room"])
+        # and reads it through the store rather than the state machine
+        store = self.hass.data[DATA_STORE]
+        self.assertEqual(store.get(self.motion_entity, str), "on")
+
+    def test_published_entities_are_added(self):
+        group = MotionGroup(build_config().lights["hall"])
+        added = []
+        asyncio.run(async_add_calculated(self.hass, added.extend, [group]))
+        self.assertEqual(added, [group])
+        self.assertFalse(group.internal)
+
+
+class TestDiagnosticSensors(ActuatorTestCase):
+    def sensor_names(self, config):
+        actuator = LightActuator(self.hass)
+        reconciler = LightReconciler(
+            self.hass,
+            actuator,
+            config.settings.reconcile_interval,
+            config.settings.reconcile_batch_size,
+        )
+        return [s.name for s in diagnostic_sensors(config, actuator, reconciler)]
+
+    def test_no_reconciler_by_default(self):
+        self.assertEqual(self.sensor_names(build_config()), [])
+
+    def test_reconciler(self):
+        raw = copy.deepcopy(CONFIG)
+        raw["settings"]["reconcile_interval"] = 10
+        config = build_config(raw)
+        self.assertEqual(self.sensor_names(config), [config.reconciler_entity.name])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from types import SimpleNamespace
+
+from ..store import StateStore
+
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        states = {"sensor.a": SimpleNamespace(state="7")}
+        hass = SimpleNamespace(states=SimpleNamespace(get=states.get))
+        self.store = StateStore(hass)
+
+    def test_falls_back_to_state_machine(self):
+        self.assertEqual(self.store.get("sensor.a", int), 7)
+        self.assertIsNone(self.store.get("sensor.b", int))
+
+    def test_typed_value(self):
+        self.store.set("sensor.a", 3)
+        self.assertEqual(self.store.get("sensor.a", int), 3)
+
+        self.store.remove("sensor.a")
+        self.assertEqual(self.store.get("sensor.a", int), 7)
+
+    def test_internal(self):
+        self.store.add_internal("internal.a")
+        self.assertEqual(self.store.get("internal.a", str), "unknown")
+        self.store.set("internal.a", "on")
+        self.assertEqual(self.store.get("internal.a", str), "on")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from ..timeouts import OccupancyTimeouts
+
+
+class FakeGraph:
+    def __init__(self):
+        self.changed_calls = []
+
+    def changed(self, *nodes):
+        self.changed_calls.append(sorted(n.entity_id for n in nodes))
+
+
+class FakeRoom:
+    def __init__(self, entity_id, expired):
+        self.entity_id = entity_id
+        self._dependent_entities = []
+        self._expired = expired
+
+    def _timed_out(self):
+        self._expired.append(self.entity_id)
+        return True
+
+
+class TestOccupancyTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.graph = FakeGraph()
+        self.expired = []
+
+    def room(self, entity_id):
+        return FakeRoom(entity_id, self.expired)
+
+    def sleep(self, delay):
+        self.loop.run_until_complete(asyncio.sleep(delay))
+
+    def test_expires_in_order(self):
+        timeouts = OccupancyTimeouts(self.graph, self.loop)
+        a, b = self.room("sensor.a"), self.room("sensor.b")
+        timeouts.schedule(b, 0.06)
+        timeouts.schedule(a, 0.02)
+        self.assertTrue(timeouts.is_scheduled(a))
+
+        self.sleep(0.04)
+        self.assertEqual(self.expired, ["sensor.a"])
+        self.assertFalse(timeouts.is_scheduled(a))
+        self.sleep(0.04)
+        self.assertEqual(self.expired, ["sensor.a", "sensor.b"])
+        self.assertEqual(self.graph.changed_calls, [["sensor.a"], ["sensor.b"]])
+
+    def test_reschedule_and_cancel(self):
+        timeouts = OccupancyTimeouts(self.graph, self.loop)
+        a, b = self.room("sensor.a"), self.room("sensor.b")
+        timeouts.schedule(a, 0.02)
+        timeouts.schedule(b, 0.02)
+        timeouts.schedule(a, 0.06)
+        timeouts.cancel(b)
+
+        self.sleep(0.04)
+        self.assertEqual(self.expired, [])
+        self.sleep(0.04)
+        self.assertEqual(self.expired, ["sensor.a"])
+
+    def test_granularity_batches_expiries(self):
+        timeouts = OccupancyTimeouts(self.graph, self.loop, granularity=0.1)
+        timeouts.schedule(self.room("sensor.a"), 0.01)
+        timeouts.schedule(self.room("sensor.b"), 0.01)
+
+        self.sleep(0.25)
+        self.assertEqual(self.graph.changed_calls, [["sensor.a", "sensor.b"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
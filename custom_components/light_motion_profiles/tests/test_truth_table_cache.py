@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from .. import truth_table_cache
+from ..exhaustive import build_truth_table
+from ..truth_table_cache import (
+    TruthTableCache,
+    build_decision_table_cached,
+    light_group_key,
+)
+from .test_exhaustive import build_config
+
+
+class TestTruthTableCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config = build_config()
+        self.group = self.config.lights["hall"]
+
+    def test_round_trip(self):
+        cache = TruthTableCache(self.tmp.name)
+        table = build_truth_table(self.group, self.config, use_numpy=False)
+        key = light_group_key(self.group, self.config)
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, table)
+        cached = cache.get(key)
+        assert cached is not None
+        self.assertEqual(list(cached.rows(self.config)), list(table.rows(self.config)))
+
+    def test_key(self):
+        key = light_group_key(self.group, self.config)
+        self.assertEqual(key, light_group_key(self.group, build_config()))
+
+        # States interned at runtime don't change the table
+        self.config.settings.state_encoding.bit("unavailable")
+        self.assertEqual(key, light_group_key(self.group, self.config))
+
+        self.group.rules.pop()
+        self.assertNotEqual(key, light_group_key(self.group, self.config))
+
+    def test_evicts_least_recently_used(self):
+        table = build_truth_table(self.group, self.config, use_numpy=False)
+        cache = TruthTableCache(self.tmp.name)
+        for i, key in enumerate(["a", "b", "c"]):
+            cache.put(key, table)
+            os.utime(os.path.join(self.tmp.name, f"{key}.lmpt"), (i, i))
+
+        # Reading "a" makes "b" the least recently used
+        cache.get("a")
+        size = os.path.getsize(os.path.join(self.tmp.name, "a.lmpt"))
+        cache.max_bytes = size * 2
+        cache.evict()
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_unwritable_cache(self):
+        # The cache directory can't be created under a file
+        blocker = os.path.join(self.tmp.name, "file")
+        open(blocker, "w").close()
+        cache = TruthTableCache(os.path.join(blocker, "cache"))
+
+        with self.assertLogs(truth_table_cache._LOGGER.name, "WARNING"):
+            table = build_decision_table_cached(self.group, self.config, cache)
+        key = light_group_key(self.group, self.config)
+        self.assertIsNone(cache.get(key))
+        self.assertGreater(len(table.decisions), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+A single scheduler for the occupancy timeouts of every room.
+"""
+import asyncio
+import heapq
+import math
+from typing import Dict, List, Protocol, Set
+
+from homeassistant.core import HomeAssistant
+
+from .graph import DependencyGraph, GraphNode
+
+
+DATA_TIMEOUTS = "light_motion_profiles_timeouts"
+
+
+class TimeoutNode(GraphNode, Protocol):
+    def _timed_out(self) -> bool:
+        """
+        Applies the timeout, returns True if the state changed
+        """
+
+
+class OccupancyTimeouts:
+    def __init__(
+        self,
+        graph: DependencyGraph,
+        loop: asyncio.AbstractEventLoop,
+        granularity: float = 0.0,
+    ) -> None:
+        self._graph = graph
+        self._loop = loop
+        self._granularity = granularity
+
+        self._deadlines: Dict[TimeoutNode, float] = {}
+        self._buckets: Dict[float, Set[TimeoutNode]] = {}
+        # The deadline of every bucket, buckets emptied by cancellations are
+        # only dropped once they're reached
+        self._heap: List[float] = []
+
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _bucket(self, deadline: float) -> float:
+        # Round up so nothing ever times out early
+        if self._granularity <= 0:
+            return deadline
+        return math.ceil(deadline / self._granularity) * self._granularity
+
+    def is_scheduled(self, node: TimeoutNode) -> bool:
+        return node in self._deadlines
+
+    def schedule(self, node: TimeoutNode, delay: float) -> None:
+        """
+        Times out node after delay seconds, replacing any timeout it already has
+        """
+        self.cancel(node)
+        deadline = self._bucket(self._loop.time() + delay)
+        self._deadlines[node] = deadline
+
+        bucket = self._buckets.get(deadline)
+        if bucket is None:
+            bucket = self._buckets[deadline] = set()
+            heapq.heappush(self._heap, deadline)
+        bucket.add(node)
+
+        if self._timer is None or deadline < self._timer.when():
+            self._arm(deadline)
+
+    def cancel(self, node: TimeoutNode) -> None:
+        deadline = self._deadlines.pop(node, None)
+        if deadline is not None:
+            self._buckets[deadline].discard(node)
+
+    def _arm(self, deadline: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_at(deadline, self._expire)
+
+    def _expire(self) -> None:
+        # The loop runs timers up to its clock resolution early, the deadline
+        # we were armed for has been reached regardless
+        assert self._timer is not None
+        now = max(self._loop.time(), self._timer.when())
+        self._timer = None
+
+        expired: List[TimeoutNode] = []
+        while self._heap and self._heap[0] <= now:
+            for node in self._buckets.pop(heapq.heappop(self._heap)):
+                del self._deadlines[node]
+                expired.append(node)
+
+        if self._heap:
+            self._arm(self._heap[0])
+
+        changed = [node for node in expired if node._timed_out()]
+        if changed:
+            self._graph.changed(*changed)
+
+
+def get_timeouts(hass: HomeAssistant) -> OccupancyTimeouts:
+    return hass.data[DATA_TIMEOUTS]
@@ -0,0 +1,296 @@
+"""
+A persistent, size capped cache of TruthTables keyed by a hash of everything
+the table of a light group depends on.
+"""
+
+import array
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, List, Mapping, Sequence, Tuple
+
+from .datatypes import Config, LightGroup
+from .datatypes.match import (
+    MatchSingle,
+    MatchSingleAny,
+    MatchSingleExplicit,
+    MatchSingleWildcard,
+    MatchUser,
+    MatchUserSingle,
+    MatchUserWildcard,
+)
+from .exhaustive import (
+    DecisionTable,
+    TruthTable,
+    build_truth_table,
+    build_truth_tables,
+    cell_states,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump whenever the way tables are built or stored changes so old files are
+# never read back
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_MAGIC = b"LMPT"
+# magic, version, rows, metadata length
+_HEADER = struct.Struct("=4sIQI")
+_INDEX_FORMAT = "i"
+_STATE_FORMAT = "q"
+_SUFFIX = ".lmpt"
+
+
+def _match_single_key(match: MatchSingle) -> Any:
+    if isinstance(match, MatchSingleExplicit):
+        return ["explicit", match.value]
+    elif isinstance(match, MatchSingleAny):
+        return ["any", sorted(match.value)]
+    elif isinstance(match, MatchSingleWildcard):
+        return ["*"]
+    raise NotImplementedError(f"Unknown type of match '{type(match).__name__}'")
+
+
+def _match_user_key(match: MatchUser) -> Any:
+    if isinstance(match, MatchUserSingle):
+        multi = match.match_multi
+        return [
+            match.user,
+            type(multi).__name__,
+            _match_single_key(multi.single),
+            multi.mask,
+        ]
+    elif isinstance(match, MatchUserWildcard):
+        return ["*"]
+    raise NotImplementedError(f"Unknown type of user match '{type(match).__name__}'")
+
+
+def light_group_key(group: LightGroup, config: Config) -> str:
+    """
+    A stable hash of everything that the truth table of a light group depends
+    on: the rules, the membership of the users in them and the state settings.
+    States the encoding interns at runtime don't change the table so they're
+    left out, the bits of the states rules name are in their user matches
+    """
+    encoding = config.settings.state_encoding
+    room_states, occupancy_states = cell_states(config)
+    rules = [
+        [
+            rule.state_name,
+            _match_single_key(rule.rule_match.room_state),
+            _match_single_key(rule.rule_match.occupancy),
+            [_match_user_key(m) for m in rule.rule_match.user_state],
+        ]
+        for rule in group.rules
+    ]
+    users = [
+        [
+            name,
+            name in config.users_groups.users,
+            sorted(config.users_groups.members(name)),
+        ]
+        for name in sorted(group.get_rule_users())
+    ]
+    data = {
+        "version": CACHE_VERSION,
+        "person_states": [
+            [encoding.decode_single(state), state] for state in encoding.person_states
+        ],
+        "absent": [encoding.decode_single(encoding.absent), encoding.absent],
+        "room_states": room_states,
+        "occupancy_states": occupancy_states,
+        "rules": rules,
+        "users": users,
+    }
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _column_bytes(column: Sequence[int], fmt: str) -> bytes:
+    return array.array(fmt, column).tobytes()
+
+
+def _padding(offset: int) -> bytes:
+    return b"\0" * (-offset % 8)
+
+
+def dump_truth_table(table: TruthTable) -> bytes:
+    metadata = json.dumps(
+        {
+            "room_states": table.room_states,
+            "occupancy_states": table.occupancy_states,
+            "users": table.users,
+            "rule_names": table.rule_names,
+        }
+    ).encode()
+
+    out = bytearray(_HEADER.pack(_MAGIC, CACHE_VERSION, len(table), len(metadata)))
+    out += metadata
+    columns = [
+        (table.room, _INDEX_FORMAT),
+        (table.occupancy, _INDEX_FORMAT),
+        (table.rule, _INDEX_FORMAT),
+    ] + [(column, _STATE_FORMAT) for column in table.user_states]
+    for column, fmt in columns:
+        # Keep every column aligned so it can be viewed directly in the mmap
+        out += _padding(len(out))
+        out += _column_bytes(column, fmt)
+    return bytes(out)
+
+
+def load_truth_table(buffer: memoryview) -> TruthTable:
+    magic, version, rows, metadata_len = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC or version != CACHE_VERSION:
+        raise ValueError(f"Not a version {CACHE_VERSION} truth table")
+
+    offset = _HEADER.size
+    metadata = json.loads(bytes(buffer[offset : offset + metadata_len]))
+    offset += metadata_len
+
+    def column(fmt: str) -> memoryview:
+        nonlocal offset
+        offset += -offset % 8
+        size = rows * struct.calcsize(fmt)
+        if offset + size > len(buffer):
+            raise ValueError("Truth table is truncated")
+        out = buffer[offset : offset + size].cast(fmt)
+        offset += size
+        return out
+
+    room = column(_INDEX_FORMAT)
+    occupancy = column(_INDEX_FORMAT)
+    rule = column(_INDEX_FORMAT)
+    user_states: List[Sequence[int]] = [
+        column(_STATE_FORMAT) for _ in metadata["users"]
+    ]
+    return TruthTable(
+        room_states=metadata["room_states"],
+        occupancy_states=metadata["occupancy_states"],
+        users=metadata["users"],
+        rule_names=metadata["rule_names"],
+        room=room,
+        occupancy=occupancy,
+        user_states=user_states,
+        rule=rule,
+    )
+
+
+class TruthTableCache:
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + _SUFFIX)
+
+    def get(self, key: str) -> TruthTable | None:
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            table = load_truth_table(memoryview(mapped))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            _LOGGER.warning(f"Ignoring unreadable truth table cache file {path}: {e}")
+            return None
+
+        # mtime is the last use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return table
+
+    def put(self, key: str, table: TruthTable) -> None:
+        """
+        Adds table to the cache. The cache is only an optimisation so failing to
+        write it (eg a read only or full disk) is logged rather than raised
+        """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        except OSError as e:
+            _LOGGER.warning(f"Not caching truth table in {self.path}: {e}")
+            return
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dump_truth_table(table))
+            os.replace(tmp_path, self._file(key))
+            self.evict()
+        except OSError as e:
+            _LOGGER.warning(f"Not caching truth table in {self.path}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def evict(self) -> None:
+        files: List[Tuple[float, int, str]] = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(_SUFFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def build_truth_tables_cached(
+    config: Config,
+    cache: TruthTableCache,
+    use_numpy: bool | None = None,
+    jobs: int = 1,
+    light_groups: List[str] | None = None,
+) -> Mapping[str, TruthTable]:
+    """
+    The same as build_truth_tables but only light groups that aren't in the
+    cache are built, and they're added to it
+    """
+    if light_groups is None:
+        light_groups = list(config.lights)
+
+    keys = {name: light_group_key(config.lights[name], config) for name in light_groups}
+    out = {name: cache.get(key) for name, key in keys.items()}
+    missing = [name for name, table in out.items() if table is None]
+    if missing:
+        _LOGGER.info(f"Building truth tables for {', '.join(missing)}")
+        built = build_truth_tables(config, use_numpy, jobs, light_groups=missing)
+        for name, table in built.items():
+            cache.put(keys[name], table)
+            out[name] = table
+
+    return {name: table for name, table in out.items() if table is not None}
+
+
+def build_decision_table_cached(
+    group: LightGroup, config: Config, cache: TruthTableCache, key: str | None = None
+) -> DecisionTable:
+    """
+    Pass the key from the event loop when this runs in an executor, the
+    encoding it reads is shared with the entities
+    """
+    if key is None:
+        key = light_group_key(group, config)
+    table = cache.get(key)
+    if table is None:
+        table = build_truth_table(group, config)
+        cache.put(key, table)
+    return DecisionTable.from_truth_table(table)